@@ -34,6 +34,11 @@ from random import random
 from pacman import Directions
 import util
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 #
 # Parameters
 #
@@ -151,17 +156,22 @@ def food(state):
     #
     # In both cases, walls block the view.
     
-    foodList= []
-    foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
-            
     # Return list of food that is visible
-    return foodList
+    return sorted(state.getFoodSet())
+
+def foodSet(state):
+    # Returns the food positions as a frozenset.
+    #
+    # The set is carried over from one state to the next with the
+    # eaten food taken out, so unlike food() this does not have to
+    # look at every square of the board.
+
+    return state.getFoodSet()
+
+def capsuleSet(state):
+    # Returns the capsule positions as a frozenset.
+
+    return state.getCapsuleSet()
 
 def walls(state):
     # Returns a list of (x, y) pairs of wall positions
@@ -170,15 +180,21 @@ def walls(state):
     # extracted from the state data.  In later versions, this will be
     # restricted by distance, and include some uncertainty.
     
-    wallList= []
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    for i in range(width):
-        for j in range(height):
-            if wallGrid[i][j] == True:
-                wallList.append((i, j))            
-    return wallList
+    return list(state.data.layout.getStructure().wallList)
+
+def wallSet(state):
+    # Returns the wall positions as a frozenset.
+    #
+    # The walls never change, so the set is made once per layout and
+    # the same one is returned every time.
+
+    return state.getWallSet()
+
+def wallBits(state):
+    # Returns the walls as a BitGrid (see game.py), made once per
+    # layout: wallBits(state)[x][y] is True if there is a wall at (x, y).
+
+    return state.data.layout.getStructure().wallBits
 
 def corners(state):
     # Returns the coordinates of the four corners of the state space.
@@ -194,7 +210,16 @@ def corners(state):
     corners.append((0, height-1))
     corners.append((width-1, height-1))
     return corners
-                
+
+def layoutText(state):
+    # Returns the text of the layout being played, one string per row.
+    #
+    # The layout never changes during a game, so this makes a good
+    # key for anything that is computed from the walls and can be
+    # reused from one move (or one game) to the next.
+
+    return state.data.layout.layoutText
+
 #
 # Acting
 #
@@ -240,6 +265,54 @@ def makeMove(direction, legal):
         # specified direction
         return direction
 
+# The numbers makeMoves uses for the directions, and the moves that
+# selectNewMove makes when Pacman slips to the left or to the right
+# of each of them.
+MOVES = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+NORTH, SOUTH, EAST, WEST, STOP = range(5)
+LEFT = [WEST, EAST, NORTH, SOUTH, STOP]
+RIGHT = [EAST, WEST, SOUTH, NORTH, STOP]
+
+# The generator makeMoves uses unless it is given one. It is seeded
+# from random() the first time it is needed, so fixing the seed of
+# the game (pacman.py -f) fixes it too.
+moveGenerator = None
+
+def makeMoves(directions, legal, generator=None, probability=None, noisy=None):
+    # makeMove for many moves at once, with numpy.
+    #
+    # directions is an array of n direction numbers (see MOVES) and
+    # legal an (n, 5) array of booleans, legal[i][d] saying whether
+    # direction d is legal for move i. Returns the n directions
+    # actually taken, as numbers.
+    #
+    # Each move follows the same model as makeMove: the intended
+    # direction with probability directionProb, otherwise a slip to
+    # either side with even odds, and STOP for an illegal move. STOP
+    # itself is never changed. generator is a numpy RandomState; pass
+    # one made with a seed to get the same moves every time.
+    # probability and noisy stand in for directionProb and
+    # nonDeterministic when they are given.
+
+    global moveGenerator
+    if numpy is None:
+        raise Exception('makeMoves needs numpy to be installed')
+    directions = numpy.asarray(directions, dtype=int)
+    legal = numpy.asarray(legal, dtype=bool)
+    if probability is None: probability = directionProb
+    if noisy is None: noisy = nonDeterministic
+    if noisy:
+        if generator is None:
+            if moveGenerator is None:
+                moveGenerator = numpy.random.RandomState(int(random() * 0xFFFFFFFF))
+            generator = moveGenerator
+        n = len(directions)
+        slip = generator.random_sample(n) > probability
+        left = generator.random_sample(n) <= 0.5
+        slipped = numpy.where(left, numpy.take(LEFT, directions), numpy.take(RIGHT, directions))
+        directions = numpy.where(slip, slipped, directions)
+    return numpy.where(legal[numpy.arange(len(directions)), directions], directions, STOP)
+
 #
 # Details that you don't need to look at if you don't want to.
 #
@@ -261,59 +334,13 @@ def inFront(object, facing, state):
     # Returns true if the object is along the corridor in the
     # direction of the parameter "facing" before a wall gets in the
     # way.
-    
-    pacman = state.getPacmanPosition()
-    pacman_x = pacman[0]
-    pacman_y = pacman[1]
-    wallList = walls(state)
-
-    # If Pacman is facing North
-    if facing == Directions.NORTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y + 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] + 1)
-        return False
-
-    # If Pacman is facing South
-    if facing == Directions.SOUTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y - 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] - 1)
-        return False
+    #
+    # How far the corridor goes from each square in each direction is
+    # worked out once per layout (see Visibility in layout.py), so
+    # this does not have to walk along it.
 
-    # If Pacman is facing East
-    if facing == Directions.EAST:
-        # Check if the object is anywhere due East of Pacman before a
-        # wall intervenes.
-        next = (pacman_x + 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] + 1, pacman_y)
-        return False
-    
-    # If Pacman is facing West
-    if facing == Directions.WEST:
-        # Check if the object is anywhere due West of Pacman before a
-        # wall intervenes.
-        next = (pacman_x - 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] - 1, pacman_y)
-        return False
+    visibility = state.data.layout.getVisibility()
+    return visibility.inFront(state.getPacmanPosition(), facing, object)
 
 def atSide(object, facing, state):
     # Returns true if the object is in a side corridor perpendicular
@@ -0,0 +1,308 @@
+# batchSimulator.py
+# -----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+# Many independent games of classic Pacman on one layout, played in
+# lockstep with numpy.
+#
+# The games follow the rules in pacman.py (PacmanRules and GhostRules),
+# Pacman's moves are made noisy the way api.makeMove does it, and the
+# ghosts play like RandomGhost or DirectionalGhost. Only the random
+# numbers are drawn differently, so a batch of games has the same
+# distribution of outcomes as games played one at a time, but not the
+# same individual games.
+#
+# Positions are kept in half cells, as scared ghosts move half a cell at
+# a time: the cell (x, y) is at (2 * x, 2 * y).
+
+import api
+import pacman
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Actions are numbered the way api.makeMoves numbers them
+ACTIONS = api.MOVES
+NORTH, SOUTH, EAST, WEST, STOP = range(5)
+DX = [0, 0, 1, -1, 0]
+DY = [1, -1, 0, 0, 0]
+REVERSE = [SOUTH, NORTH, WEST, EAST, STOP]
+
+GHOST_POLICIES = ['random', 'directional']
+
+class BatchSimulator:
+    """
+    numGames games on one layout, stepped together.
+
+    The state of game i is in row i of the arrays:
+
+      pacman      - (numGames, 2) Pacman's position, in half cells
+      ghosts      - (numGames, numGhosts, 2) the ghosts' positions
+      directions  - (numGames, numGhosts) the ghosts' directions
+      scared      - (numGames, numGhosts) the ghosts' scared timers
+      food        - (numGames, width, height) where the food is left
+      capsules    - (numGames, numCapsules) which capsules are left
+      scores, won, lost, moves - (numGames,)
+
+    A game that has been won or lost stays as it ended while the others
+    go on.
+    """
+
+    def __init__(self, layout, numGames, ghostPolicy='random', numGhosts=None, seed=None,
+                 directionProb=api.directionProb, nonDeterministic=api.nonDeterministic,
+                 prob_attack=0.8, prob_scaredFlee=0.8):
+        if numpy is None:
+            raise Exception('The batch simulator needs numpy to be installed')
+        if ghostPolicy not in GHOST_POLICIES:
+            raise Exception('Unknown ghost policy ' + str(ghostPolicy) + ', expected one of ' + ', '.join(GHOST_POLICIES))
+        self.layout = layout
+        self.numGames = numGames
+        self.ghostPolicy = ghostPolicy
+        self.directionProb = directionProb
+        self.nonDeterministic = nonDeterministic
+        self.prob_attack = prob_attack
+        self.prob_scaredFlee = prob_scaredFlee
+        self.random = numpy.random.RandomState(seed)
+
+        self.width, self.height = layout.width, layout.height
+        self.walls = numpy.array(layout.walls.data, dtype=bool)
+        # open[x, y, a]: whether action a can be taken from cell (x, y)
+        self.open = numpy.zeros((self.width, self.height, len(ACTIONS)), dtype=bool)
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x, y]: continue
+                for a in range(len(ACTIONS)):
+                    self.open[x, y, a] = not layout.walls[x + DX[a]][y + DY[a]]
+
+        ghostStarts = [pos for isPacman, pos in layout.agentPositions if not isPacman]
+        if numGhosts is not None:
+            ghostStarts = ghostStarts[:numGhosts]
+        self.numGhosts = len(ghostStarts)
+        self.pacmanStart = numpy.array([2 * c for c in layout.agentPositions[0][1]], dtype=int)
+        self.ghostStarts = numpy.array([[2 * c for c in pos] for pos in ghostStarts], dtype=int).reshape(-1, 2)
+        self.capsulePositions = numpy.array(layout.capsules, dtype=int).reshape(-1, 2)
+        self.reset()
+
+    def reset(self):
+        """
+        Puts every game back at the start.
+        """
+        n = self.numGames
+        self.pacman = numpy.tile(self.pacmanStart, (n, 1))
+        self.ghosts = numpy.tile(self.ghostStarts, (n, 1, 1))
+        self.directions = numpy.full((n, self.numGhosts), STOP, dtype=int)
+        self.scared = numpy.zeros((n, self.numGhosts), dtype=int)
+        self.food = numpy.tile(numpy.array(self.layout.food.data, dtype=bool), (n, 1, 1))
+        self.foodLeft = self.food.reshape(n, -1).sum(axis=1)
+        self.capsules = numpy.ones((n, len(self.capsulePositions)), dtype=bool)
+        self.scores = numpy.zeros(n, dtype=int)
+        self.won = numpy.zeros(n, dtype=bool)
+        self.lost = numpy.zeros(n, dtype=bool)
+        self.moves = numpy.zeros(n, dtype=int)
+
+    def done(self):
+        return self.won | self.lost
+
+    def pacmanCells(self):
+        """
+        Returns the cell Pacman is in, in every game, as two arrays x and y.
+        """
+        return self.pacman[:, 0] // 2, self.pacman[:, 1] // 2
+
+    def legalPacmanActions(self):
+        """
+        Returns a (numGames, 5) array saying which actions Pacman can take.
+        """
+        x, y = self.pacmanCells()
+        return self.open[x, y]
+
+    def noisyMoves(self, actions):
+        """
+        What api.makeMove does to Pacman's choice of action, in every game:
+        the action is taken with probability directionProb, and otherwise
+        Pacman slips to one side or the other; a move into a wall is a STOP.
+        """
+        return api.makeMoves(actions, self.legalPacmanActions(), self.random,
+                             self.directionProb, self.nonDeterministic)
+
+    def stepPacman(self, actions):
+        """
+        Makes Pacman's move in every game still going, given the action
+        Pacman chose in each (before any noise). Returns the actions actually
+        taken.
+        """
+        active = ~self.done()
+        taken = numpy.where(active, self.noisyMoves(actions), STOP)
+        change = numpy.zeros(self.numGames, dtype=int)
+        games = numpy.arange(self.numGames)
+
+        self.pacman[:, 0] += 2 * numpy.take(DX, taken)
+        self.pacman[:, 1] += 2 * numpy.take(DY, taken)
+        x, y = self.pacmanCells()
+
+        # PacmanRules.consume
+        eaten = active & self.food[games, x, y]
+        self.food[games[eaten], x[eaten], y[eaten]] = False
+        self.foodLeft -= eaten
+        change += 10 * eaten
+        won = eaten & (self.foodLeft == 0)
+        change += 500 * won
+        for c, (cx, cy) in enumerate(self.capsulePositions):
+            hit = active & self.capsules[:, c] & (x == cx) & (y == cy)
+            self.capsules[hit, c] = False
+            self.scared[hit] = pacman.SCARED_TIME
+
+        change -= pacman.TIME_PENALTY * active
+        lost = numpy.zeros(self.numGames, dtype=bool)
+        for g in range(self.numGhosts):
+            lost |= self._checkDeath(g, active, won, change)
+
+        self.scores += change
+        self.won |= won
+        self.lost |= lost
+        self.moves += active
+        return taken
+
+    def ghostDistribution(self, g, legal):
+        """
+        Returns the probability of each action for ghost g in every game, as
+        a (numGames, 5) array, given the legal actions.
+        """
+        numLegal = legal.sum(axis=1)[:, None]
+        uniform = numpy.where(legal, 1.0 / numpy.maximum(numLegal, 1), 0.0)
+        if self.ghostPolicy == 'random':
+            return uniform
+
+        # DirectionalGhost: the actions that take the ghost closest to
+        # Pacman (furthest when scared) are preferred
+        isScared = self.scared[:, g] > 0
+        speed = numpy.where(isScared, 1, 2)[:, None]
+        nx = self.ghosts[:, g, 0][:, None] + speed * numpy.array(DX)[None, :]
+        ny = self.ghosts[:, g, 1][:, None] + speed * numpy.array(DY)[None, :]
+        distance = numpy.abs(nx - self.pacman[:, 0][:, None]) + numpy.abs(ny - self.pacman[:, 1][:, None])
+        big = 4 * (self.width + self.height)
+        closest = numpy.where(legal, distance, big).min(axis=1)[:, None]
+        furthest = numpy.where(legal, distance, -big).max(axis=1)[:, None]
+        bestScore = numpy.where(isScared[:, None], furthest, closest)
+        best = legal & (distance == bestScore)
+        bestProb = numpy.where(isScared, self.prob_scaredFlee, self.prob_attack)[:, None]
+        numBest = numpy.maximum(best.sum(axis=1)[:, None], 1)
+        return numpy.where(best, bestProb / numBest, 0.0) + (1 - bestProb) * uniform
+
+    def legalGhostActions(self, g):
+        """
+        Returns a (numGames, 5) array saying which actions ghost g can take:
+        never STOP, and only back the way it came if there is no other way.
+        Between cells, a ghost carries on as it was going.
+        """
+        gx, gy = self.ghosts[:, g, 0], self.ghosts[:, g, 1]
+        direction = self.directions[:, g]
+        onGrid = (gx % 2 == 0) & (gy % 2 == 0)
+        legal = self.open[gx // 2, gy // 2].copy()
+        legal[:, STOP] = False
+        games = numpy.arange(self.numGames)
+        reverse = numpy.take(REVERSE, direction)
+        canReverse = legal.sum(axis=1) <= 1
+        legal[games, reverse] &= canReverse | (reverse == STOP)
+        straight = numpy.zeros_like(legal)
+        straight[games, direction] = True
+        return numpy.where(onGrid[:, None], legal, straight)
+
+    def stepGhost(self, g):
+        """
+        Makes ghost g's move in every game still going. Returns the actions
+        it took.
+        """
+        active = ~self.done()
+        legal = self.legalGhostActions(g)
+        distribution = self.ghostDistribution(g, legal)
+        cumulative = distribution.cumsum(axis=1)
+        draw = self.random.random_sample(self.numGames)[:, None] * cumulative[:, -1:]
+        taken = (cumulative <= draw).sum(axis=1)
+        taken = numpy.minimum(taken, STOP)
+        taken = numpy.where(active & legal.any(axis=1), taken, STOP)
+
+        speed = numpy.where(self.scared[:, g] > 0, 1, 2)
+        self.ghosts[:, g, 0] += speed * numpy.take(DX, taken)
+        self.ghosts[:, g, 1] += speed * numpy.take(DY, taken)
+        self.directions[:, g] = numpy.where(taken == STOP, self.directions[:, g], taken)
+
+        # GhostRules.decrementTimer
+        timer = self.scared[:, g]
+        snap = active & (timer == 1)
+        self.ghosts[snap, g] = 2 * ((self.ghosts[snap, g] + 1) // 2)
+        self.scared[:, g] = numpy.where(active, numpy.maximum(0, timer - 1), timer)
+
+        change = numpy.zeros(self.numGames, dtype=int)
+        lost = self._checkDeath(g, active, numpy.zeros(self.numGames, dtype=bool), change)
+        self.scores += change
+        self.lost |= lost
+        return taken
+
+    def _checkDeath(self, g, active, won, change):
+        # GhostRules.checkDeath and GhostRules.collide, for ghost g. Adds to
+        # change and returns the games Pacman lost.
+        distance = numpy.abs(self.ghosts[:, g] - self.pacman).sum(axis=1)
+        # COLLISION_TOLERANCE is in cells, the positions are in half cells
+        collide = active & (distance <= 2 * pacman.COLLISION_TOLERANCE)
+        eaten = collide & (self.scared[:, g] > 0)
+        change += 200 * eaten
+        self.ghosts[eaten, g] = self.ghostStarts[g]
+        self.directions[eaten, g] = STOP
+        self.scared[eaten, g] = 0
+        lost = collide & ~eaten & ~won
+        change -= 500 * lost
+        return lost
+
+    def step(self, actions):
+        """
+        Plays one round, Pacman's move followed by each ghost's, in every
+        game still going.
+        """
+        self.stepPacman(actions)
+        for g in range(self.numGhosts):
+            self.stepGhost(g)
+
+    def run(self, policy, maxMoves=1000):
+        """
+        Plays every game to the end, or until Pacman has made maxMoves moves.
+        policy is called with the simulator before each round and returns
+        the action Pacman chooses in every game.
+
+        Returns the final scores and whether each game was won.
+        """
+        while not self.done().all() and self.moves.max() < maxMoves:
+            self.step(policy(self))
+        return self.scores.copy(), self.won.copy()
+
+def tablePolicy(table):
+    """
+    Makes a policy for BatchSimulator.run from a table of the action to take
+    in each cell: table[x][y] is a Directions value (or None in walls), as in
+    an MDP policy.
+    """
+    codes = numpy.array([[ACTIONS.index(a) if a in ACTIONS else STOP for a in column] for column in table], dtype=int)
+    def policy(simulator):
+        x, y = simulator.pacmanCells()
+        return codes[x, y]
+    return policy
+
+def randomPolicy(simulator):
+    """
+    Picks any legal move but STOP, like sampleAgents.RandomAgent.
+    """
+    legal = simulator.legalPacmanActions().copy()
+    legal[:, STOP] = False
+    weights = legal * simulator.random.random_sample(legal.shape)
+    return weights.argmax(axis=1)
@@ -0,0 +1,264 @@
+# bench.py
+# --------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+Benchmarks the game and the agents.
+
+Plays a fixed matrix of games: every agent in AGENTS against every ghost
+in GHOSTS on every layout in layouts/, with each game seeded from its
+place in the matrix, so two runs play the same games. For every cell of
+the matrix it reports moves per second, the mean and 95th percentile
+time Pacman took over getAction, the peak memory use and the win rate.
+
+  python bench.py                                  # the whole matrix
+  python bench.py -l smallClassic,mediumClassic -o new.json
+  python bench.py -o new.json --baseline old.json  # fails on a regression
+
+Each cell is played in a fresh process, so that its peak memory use is
+its own.
+"""
+
+from pacman import ClassicGameRules
+from pacman import loadAgent
+from pacman import parseAgentArgs
+import imp
+import layout
+import json
+import math
+import os
+import random
+import sys
+import time
+
+try:
+    imp.find_module('numpy')
+    MDP_SOLVER = 'numpy'
+except ImportError:
+    MDP_SOLVER = 'sparse'
+
+# The Pacman agents benchmarked, with their -a options. MDPAgent is played
+# as -p MDPAgent plays it, with its own value iteration loop, as well as
+# with the fastest solver there is here
+AGENTS = [('MDPAgent', ''), ('MDPAgent', 'solver=' + MDP_SOLVER), ('GreedyAgent', ''), ('RandomAgent', '')]
+
+GHOSTS = ['RandomGhost', 'DirectionalGhost']
+
+# Cells played in less time than this are too short to time reliably, and
+# only their win rate is compared with the baseline
+MIN_SECONDS = 0.5
+
+def allLayouts():
+    return sorted([f[:-4] for f in os.listdir('layouts') if f.endswith('.lay')])
+
+class BenchRules(ClassicGameRules):
+    """
+    The classic rules, except that a game is stopped once Pacman has made
+    maxMoves moves, so that agents that never finish do not hold up the
+    benchmark.
+    """
+    def __init__(self, maxMoves, timeout=30):
+        ClassicGameRules.__init__(self, timeout)
+        self.maxMoves = maxMoves
+        self.capped = False
+
+    def process(self, state, game):
+        ClassicGameRules.process(self, state, game)
+        if not game.gameOver and len(game.moveHistory) >= self.maxMoves * len(game.agents):
+            game.gameOver = True
+            self.capped = True
+
+def percentile(values, p):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[max(int(math.ceil(p * len(values))) - 1, 0)]
+
+def peakMemory():
+    """
+    Returns the peak resident memory of this process in kilobytes, or None
+    where that is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': peak /= 1024 # bytes there
+    return peak
+
+def runCell(cell):
+    """
+    Plays the games of one cell of the matrix and returns its results as a
+    dictionary.
+    """
+    import textDisplay
+    agentName, agentArgs, ghostName, layoutName, numGames, maxMoves = cell
+    result = {'agent': agentName, 'agentArgs': agentArgs, 'ghost': ghostName, 'layout': layoutName}
+    try:
+        board = layout.getLayout(layoutName)
+        pacmanAgent = loadAgent(agentName, True)(**parseAgentArgs(agentArgs or None))
+        ghostType = loadAgent(ghostName, True)
+        ghosts = [ghostType(i + 1) for i in range(board.getNumGhosts())]
+
+        # Time every call to getAction
+        latencies = []
+        getAction = pacmanAgent.getAction
+        def timedGetAction(state):
+            start = time.time()
+            action = getAction(state)
+            latencies.append(time.time() - start)
+            return action
+        pacmanAgent.getAction = timedGetAction
+
+        wins = 0
+        capped = 0
+        moves = 0
+        scores = []
+        start = time.time()
+        for i in range(numGames):
+            random.seed('%s-%s-%s-%d' % (agentName, ghostName, layoutName, i))
+            rules = BenchRules(maxMoves)
+            game = rules.newGame(board, pacmanAgent, ghosts, textDisplay.NullGraphics(), True, False)
+            game.run()
+            moves += len(game.moveHistory)
+            scores.append(game.state.getScore())
+            if game.state.isWin(): wins += 1
+            if rules.capped: capped += 1
+        seconds = time.time() - start
+    except Exception, e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        return result
+
+    result.update({
+        'games': numGames,
+        'wins': wins,
+        'winRate': wins / float(numGames),
+        'capped': capped,
+        'scores': scores,
+        'moves': moves,
+        'seconds': seconds,
+        'movesPerSecond': moves / seconds if seconds > 0 else 0.0,
+        'meanLatency': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p95Latency': percentile(latencies, 0.95),
+        'peakRssKb': peakMemory()
+    })
+    return result
+
+def runMatrix(agents, ghosts, layouts, numGames, maxMoves, workers=1):
+    import multiprocessing
+    cells = [(agentName, agentArgs, ghostName, layoutName, numGames, maxMoves)
+             for layoutName in layouts for agentName, agentArgs in agents for ghostName in ghosts]
+    # A new process for every cell, so that peak memory is measured per cell
+    pool = multiprocessing.Pool(workers, maxtasksperchild=1)
+    try:
+        results = []
+        for result in pool.imap(runCell, cells):
+            printResult(result)
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def cellName(result):
+    agent = result['agent']
+    if result.get('agentArgs'): agent += '[%s]' % result['agentArgs']
+    return '%s/%s/%s' % (result['layout'], agent, result['ghost'])
+
+def printResult(result):
+    if 'error' in result:
+        print '%-52s error: %s' % (cellName(result), result['error'])
+        return
+    print '%-52s %9.1f moves/s  mean %7.2fms  p95 %7.2fms  %7s kB  won %d/%d%s' % (
+        cellName(result), result['movesPerSecond'], 1000 * result['meanLatency'], 1000 * result['p95Latency'],
+        result['peakRssKb'], result['wins'], result['games'],
+        result['capped'] and '  (%d capped)' % result['capped'] or '')
+    sys.stdout.flush()
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with those of an earlier run, cell by cell, and returns
+    a description of every regression found. Speed and latency may be off by
+    the fraction tolerance, but the win rate may not drop.
+    """
+    previous = dict((cellName(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        name = cellName(result)
+        if name not in previous or 'error' in previous[name]: continue
+        old = previous[name]
+        if 'error' in result:
+            regressions.append('%s: %s' % (name, result['error']))
+            continue
+        if result['winRate'] < old['winRate']:
+            regressions.append('%s: win rate %.2f, was %.2f' % (name, result['winRate'], old['winRate']))
+        if min(result['seconds'], old['seconds']) < MIN_SECONDS: continue
+        if result['movesPerSecond'] < old['movesPerSecond'] * (1 - tolerance):
+            regressions.append('%s: %.1f moves/s, was %.1f' % (name, result['movesPerSecond'], old['movesPerSecond']))
+        if result['p95Latency'] > old['p95Latency'] * (1 + tolerance):
+            regressions.append('%s: p95 latency %.2fms, was %.2fms' % (name, 1000 * result['p95Latency'], 1000 * old['p95Latency']))
+    return regressions
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option('-l', '--layouts', dest='layouts',
+                      help='Comma separated layouts to play [Default: all of layouts/]', default=None)
+    parser.add_option('-p', '--agents', dest='agents',
+                      help='Comma separated Pacman agents to play, from %s [Default: all]' % ', '.join(sorted(set([a for a, _ in AGENTS]))), default=None)
+    parser.add_option('-g', '--ghosts', dest='ghosts',
+                      help='Comma separated ghost agents to play, from %s [Default: all]' % ', '.join(GHOSTS), default=None)
+    parser.add_option('-n', '--numGames', dest='numGames', type='int',
+                      help='The number of games per cell [Default: %default]', default=1)
+    parser.add_option('--maxMoves', dest='maxMoves', type='int',
+                      help='Stop a game after this many Pacman moves [Default: %default]', default=1000)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help='Number of cells to play at once; more than 1 makes the timings noisier [Default: %default]', default=1)
+    parser.add_option('-o', '--output', dest='output',
+                      help='Save the results as JSON to this file', default=None)
+    parser.add_option('--baseline', dest='baseline',
+                      help='Compare with the results saved by an earlier run, and fail on a regression', default=None)
+    parser.add_option('--tolerance', dest='tolerance', type='float',
+                      help='How much slower than the baseline a cell may be, as a fraction [Default: %default]', default=0.25)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+
+    agents = AGENTS
+    if options.agents:
+        names = options.agents.split(',')
+        agents = [(name, args) for name, args in AGENTS if name in names]
+        agents += [(name, '') for name in names if name not in [a for a, _ in AGENTS]]
+    ghosts = options.ghosts and options.ghosts.split(',') or GHOSTS
+    layouts = options.layouts and options.layouts.split(',') or allLayouts()
+    return options, agents, ghosts, layouts
+
+if __name__ == '__main__':
+    options, agents, ghosts, layouts = readCommand(sys.argv[1:])
+    results = runMatrix(agents, ghosts, layouts, options.numGames, options.maxMoves, options.workers)
+
+    if options.output:
+        f = open(options.output, 'w')
+        json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f, indent=1, sort_keys=True)
+        f.close()
+
+    # Cells that fail (MDPAgent cannot play a layout without ghosts, for
+    # one) are reported, but only count as regressions if they used to work
+    if options.baseline:
+        f = open(options.baseline)
+        baseline = json.load(f)['results']
+        f.close()
+        regressions = compare(results, baseline, options.tolerance)
+        for regression in regressions:
+            print 'REGRESSION', regression
+        if regressions: sys.exit(1)
+        print 'No regressions against', options.baseline
@@ -21,7 +21,7 @@
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
 from util import *
-import time, os
+import time, os, random
 import traceback
 import sys
 
@@ -35,7 +35,15 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+    def setMoveTimeLimit(self, seconds): # told the time allowed for each move,
+                                         # in games that enforce it
+
+    In games without a display (-q), agents are handed the game's own state
+    rather than a deep copy of it. An agent that changes the states it is
+    given must set isolatedObservation to True to get a copy.
     """
+    isolatedObservation = False
+
     def __init__(self, index=0):
         self.index = index
 
@@ -190,6 +198,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if isinstance(other, BitGrid): return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -204,16 +213,30 @@ class Grid:
         return hash(h)
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
-        return g
+        return self._withData([x[:] for x in self.data])
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
+        return self._withData(self.data)
+
+    def copyWithColumn(self, x):
+        """
+        Returns a copy that shares every column with this grid except
+        column x, so column x can be changed without touching this grid.
+        Costs O(width + height) rather than O(width * height).
+        """
+        data = self.data[:]
+        data[x] = data[x][:]
+        return self._withData(data)
+
+    def _withData(self, data):
+        # An empty Grid is cheap to build, unlike one of the full size
+        g = Grid(0, 0)
+        g.width = self.width
+        g.height = self.height
+        g.data = data
         return g
 
     def count(self, item =True ):
@@ -274,6 +297,177 @@ class Grid:
                 bools.append(False)
         return bools
 
+# BitGrid hashes are kept as the bits modulo this (Mersenne) prime
+_BITGRID_HASH_MODULUS = 2 ** 61 - 1
+
+class BitGrid(object):
+    """
+    A Grid of booleans packed into the bits of a single Python integer,
+    which can stand in for a Grid wherever grid[x][y] is used.
+
+    Cell (x,y) is bit x * height + y, the same numbering packBits uses.
+    The number of True cells and the hash are updated as cells are set,
+    so count() and hash() are O(1); a copy only copies the integer.
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        if initialValue:
+            self._setBits((1 << (width * height)) - 1)
+        else:
+            self._setBits(0)
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+        self._columns = None
+
+    def fromGrid(grid):
+        """
+        Returns a BitGrid holding the same cells as a Grid.
+        """
+        bits = 0
+        bit = 1
+        for column in grid.data:
+            for cell in column:
+                if cell: bits |= bit
+                bit <<= 1
+        g = BitGrid(grid.width, grid.height)
+        g._setBits(bits)
+        return g
+    fromGrid = staticmethod(fromGrid)
+
+    def _setBits(self, bits):
+        self.bits = bits
+        self._count = bin(bits).count('1')
+        self._hash = bits % _BITGRID_HASH_MODULUS
+
+    def _withBits(self, bits):
+        g = BitGrid(0, 0)
+        g.width = self.width
+        g.height = self.height
+        g.bits = bits
+        g._count = self._count
+        g._hash = self._hash
+        return g
+
+    def get(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y, value):
+        i = x * self.height + y
+        bit = 1 << i
+        if bool(self.bits & bit) == bool(value): return
+        if value:
+            self.bits |= bit
+            self._count += 1
+            self._hash = (self._hash + pow(2, i, _BITGRID_HASH_MODULUS)) % _BITGRID_HASH_MODULUS
+        else:
+            self.bits &= ~bit
+            self._count -= 1
+            self._hash = (self._hash - pow(2, i, _BITGRID_HASH_MODULUS)) % _BITGRID_HASH_MODULUS
+
+    def __getitem__(self, x):
+        if x < 0: x += self.width
+        if x < 0 or x >= self.width: raise IndexError('BitGrid column out of range')
+        if self._columns is None:
+            self._columns = [_BitGridColumn(self, i) for i in range(self.width)]
+        return self._columns[x]
+
+    def __str__(self):
+        out = [[str(self.get(x, y))[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.width == other.width and self.height == other.height and self.bits == other.bits
+        return self.asList() == other.asList()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def copy(self):
+        return self._withBits(self.bits)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def copyWithColumn(self, x):
+        return self.copy()
+
+    def count(self, item =True ):
+        if item: return self._count
+        return self.width * self.height - self._count
+
+    def asList(self, key = True):
+        bits = self.bits
+        if not key: bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        height = self.height
+        # Pick the set bits off from the lowest up, which is the same order Grid uses
+        while bits:
+            lowest = bits & -bits
+            i = lowest.bit_length() - 1
+            list.append( (i // height, i % height) )
+            bits ^= lowest
+        return list
+
+    def packBits(self):
+        """
+        Returns the same (width, height, bitPackedInts...) tuple as Grid.packBits
+        """
+        bits = [self.width, self.height]
+        size = self.CELLS_PER_INT
+        mask = (1 << size) - 1
+        for chunk in range(self.width * self.height // size + 1):
+            # Grid puts the first cell of each chunk in the highest bit
+            reversedBits = bin(((self.bits >> (chunk * size)) & mask) | (1 << size))[3:]
+            bits.append(int(reversedBits[::-1], 2))
+        return tuple(bits)
+
+    def _unpackBits(self, bits):
+        """
+        Fills in data from a bit-level representation
+        """
+        value = 0
+        size = self.CELLS_PER_INT
+        for chunk, packed in enumerate(bits):
+            if packed < 0: raise ValueError, "must be a positive integer"
+            value |= int(bin(packed | (1 << size))[3:][::-1], 2) << (chunk * size)
+        self._setBits(value & ((1 << (self.width * self.height)) - 1))
+
+class _BitGridColumn(object):
+    """
+    One column of a BitGrid, so that grid[x][y] reads and writes the bits.
+    """
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0: y += height
+        if y < 0 or y >= height: raise IndexError('BitGrid row out of range')
+        return (self.grid.bits >> (self.x * height + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        height = self.grid.height
+        if y < 0: y += height
+        if y < 0 or y >= height: raise IndexError('BitGrid row out of range')
+        self.grid.set(self.x, y, value)
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -368,21 +562,66 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+# Zobrist keys for food and capsules, keyed by board size.
+ZOBRIST_KEYS_CACHE = {}
+
+def zobristKeys(width, height):
+    """
+    Returns two lists of random keys for a board of the given size, one
+    for food and one for capsules, with the key of cell (x, y) at
+    x * height + y. The keys only depend on the size of the board, so
+    they are the same in every process.
     """
+    if (width, height) not in ZOBRIST_KEYS_CACHE:
+        rng = random.Random(width * 100003 + height)
+        size = width * height
+        ZOBRIST_KEYS_CACHE[(width, height)] = ([rng.getrandbits(63) for i in range(size)],
+                                               [rng.getrandbits(63) for i in range(size)])
+    return ZOBRIST_KEYS_CACHE[(width, height)]
 
+class GameStateData:
+    """
+    The food, capsules and agent states of a successor are shared with the
+    state it was generated from, and only copied when the successor changes
+    them (copy-on-write):
+
+      - food and capsules are never changed in place, they are replaced
+        (see Grid.copyWithColumn);
+      - an agent state must be fetched with writableAgentState before it is
+        changed, which copies it the first time.
+
+    A state should only be changed before any successors are generated from it.
+
+    States are hashed Zobrist-style: the hash of the food is the XOR of a
+    random key for every cell with food in it, and likewise for the
+    capsules, so eating something updates the hash in O(1) (see removeFood
+    and removeCapsule). The hash of each agent is cached until the agent is
+    fetched with writableAgentState, so only the agents that moved are
+    hashed again.
     """
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._foodHash = prevState._foodHash
+            self._capsuleHash = prevState._capsuleHash
+            self._agentHashes = prevState._agentHashes[:]
+            self._foodSet = prevState._foodSet
+            self._capsuleSet = prevState._capsuleSet
+        else:
+            self._foodHash = None
+            self._capsuleHash = None
+            self._agentHashes = []
+            self._foodSet = None
+            self._capsuleSet = None
+        self._copiedAgents = set()
 
         self._foodEaten = None
         self._foodAdded = None
@@ -395,6 +634,8 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -408,12 +649,88 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def writableAgentState( self, agentIndex ):
+        """
+        Returns the state of the given agent, copying it first if it is
+        still shared with the predecessor.
+        """
+        if agentIndex not in self._copiedAgents:
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._copiedAgents.add(agentIndex)
+        if agentIndex < len(self._agentHashes):
+            self._agentHashes[agentIndex] = None
+        return self.agentStates[agentIndex]
+
+    def removeFood( self, position ):
+        """
+        Removes the food at position, updating the hash of the food.
+        """
+        x, y = position
+        foodHash = self._getFoodHash() ^ zobristKeys(self.food.width, self.food.height)[0][x * self.food.height + y]
+        oldFood = self.food
+        self.food = self.food.copyWithColumn(x)
+        self.food[x][y] = False
+        self._foodHash = (self.food, foodHash)
+        if self._foodSet is not None and self._foodSet[0] is oldFood:
+            self._foodSet = (self.food, self._foodSet[1].difference([position]))
+
+    def removeCapsule( self, position ):
+        """
+        Removes the capsule at position, updating the hash of the capsules.
+        """
+        x, y = position
+        capsuleHash = self._getCapsuleHash() ^ zobristKeys(self.food.width, self.food.height)[1][x * self.food.height + y]
+        oldCapsules = self.capsules
+        self.capsules = [capsule for capsule in self.capsules if capsule != position]
+        self._capsuleHash = (self.capsules, capsuleHash)
+        if self._capsuleSet is not None and self._capsuleSet[0] is oldCapsules:
+            self._capsuleSet = (self.capsules, self._capsuleSet[1].difference([position]))
+
+    def getFoodSet( self ):
+        """
+        Returns the positions of the food as a frozenset. Once it has been
+        asked for, removeFood keeps it up to date for the successors.
+        """
+        if self._foodSet is None or self._foodSet[0] is not self.food:
+            self._foodSet = (self.food, frozenset(self.food.asList()))
+        return self._foodSet[1]
+
+    def getCapsuleSet( self ):
+        """
+        Returns the positions of the capsules as a frozenset, kept up to date
+        by removeCapsule.
+        """
+        if self._capsuleSet is None or self._capsuleSet[0] is not self.capsules:
+            self._capsuleSet = (self.capsules, frozenset(self.capsules))
+        return self._capsuleSet[1]
+
+    def _getFoodHash( self ):
+        # The hash is stored with the grid it belongs to, so a food grid
+        # that was replaced some other way is simply hashed again.
+        if self._foodHash is None or self._foodHash[0] is not self.food:
+            keys = zobristKeys(self.food.width, self.food.height)[0]
+            foodHash = 0
+            for x, y in self.food.asList():
+                foodHash ^= keys[x * self.food.height + y]
+            self._foodHash = (self.food, foodHash)
+        return self._foodHash[1]
+
+    def _getCapsuleHash( self ):
+        if self._capsuleHash is None or self._capsuleHash[0] is not self.capsules:
+            keys = zobristKeys(self.food.width, self.food.height)[1]
+            capsuleHash = 0
+            for x, y in self.capsules:
+                capsuleHash ^= keys[x * self.food.height + y]
+            self._capsuleHash = (self.capsules, capsuleHash)
+        return self._capsuleHash[1]
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
         """
-        if other == None: return False
-        # TODO Check for type of other
+        if other is self: return True
+        if not isinstance(other, GameStateData): return False
+        if hash(self) != hash(other): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -424,13 +741,20 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        agentHashes = self._agentHashes
+        if len(agentHashes) != len(self.agentStates):
+            agentHashes = self._agentHashes = [None] * len(self.agentStates)
+        h = self._getFoodHash() ^ self._getCapsuleHash() ^ hash(1000003 * self.score) # spread out, as hash(-1) == hash(-2)
+        for i, agentHash in enumerate( agentHashes ):
+            if agentHash is None:
+                state = self.agentStates[i]
+                if state.configuration is None:
+                    agentHash = hash((i, None, state.scaredTimer))
+                else:
+                    agentHash = hash((i, state.configuration.pos, state.configuration.direction, state.scaredTimer))
+                agentHashes[i] = agentHash
+            h ^= agentHash
+        return h
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -568,6 +892,9 @@ class Game:
         """
         Main control loop for game play.
         """
+        if not self.catchExceptions and 'checkNullDisplay' in dir(self.display) and self.display.checkNullDisplay():
+            return self.runHeadless()
+
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -583,6 +910,8 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
+            if self.catchExceptions and "setMoveTimeLimit" in dir(agent):
+                agent.setMoveTimeLimit(min(self.rules.getMoveTimeout(i), self.rules.getMoveWarningTime(i)))
             if ("registerInitialState" in dir(agent)):
                 self.mute(i)
                 if self.catchExceptions:
@@ -727,3 +1056,59 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def runHeadless( self ):
+        """
+        The control loop of run, for games with no display in which agents
+        are not timed (no -c). What each agent supports is looked up once,
+        the display is never called, agents are only muted if muteAgents is
+        set, and observations are the game's own (unchanging) states unless
+        an agent asks for a copy with isolatedObservation.
+        """
+        self.numMoves = 0
+        agents = self.agents
+        numAgents = len( agents )
+        muteAgents = self.muteAgents
+
+        for i in range(numAgents):
+            agent = agents[i]
+            if not agent:
+                print >>sys.stderr, "Agent %d failed to load" % i
+                self._agentCrash(i, quiet=True)
+                return
+            if "registerInitialState" in dir(agent):
+                if muteAgents: self.mute(i)
+                agent.registerInitialState(self.state.deepCopy())
+                if muteAgents: self.unmute()
+
+        getActions = [agent.getAction for agent in agents]
+        observationFunctions = [getattr(agent, 'observationFunction', None) for agent in agents]
+        isolated = [getattr(agent, 'isolatedObservation', False) for agent in agents]
+        moveHistory = self.moveHistory
+        rules = self.rules
+
+        agentIndex = self.startingIndex
+        while not self.gameOver:
+            if muteAgents: self.mute(agentIndex)
+            if isolated[agentIndex]:
+                observation = self.state.deepCopy()
+            else:
+                observation = self.state
+            if observationFunctions[agentIndex] is not None:
+                observation = observationFunctions[agentIndex](observation)
+            action = getActions[agentIndex](observation)
+            if muteAgents: self.unmute()
+
+            moveHistory.append( (agentIndex, action) )
+            self.state = self.state.generateSuccessor( agentIndex, action )
+            rules.process(self.state, self)
+            agentIndex = ( agentIndex + 1 ) % numAgents
+
+            if _BOINC_ENABLED:
+                boinc.set_fraction_done(self.getProgress())
+
+        for agentIndex, agent in enumerate(agents):
+            if "final" in dir( agent ):
+                if muteAgents: self.mute(agentIndex)
+                agent.final( self.state )
+                if muteAgents: self.unmute()
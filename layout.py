@@ -14,11 +14,29 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import BitGrid
+from game import Directions
+from game import Actions
+import layoutCache
 import os
 import random
+import copy
 
+# Visibility of every layout seen so far, keyed by layout text
 VISIBILITY_MATRIX_CACHE = {}
 
+# Layouts already read in this process, keyed by the path of their file and
+# the time it was last changed. getLayout hands out copies of these.
+LAYOUT_REGISTRY = {}
+
+# LayoutStructures already worked out, keyed by layout text.
+LAYOUT_STRUCTURE_CACHE = {}
+
+# Kinds of open cells, by how many ways out of them there are
+DEAD_END = 'deadEnd'
+CORRIDOR = 'corridor'
+JUNCTION = 'junction'
+
 class Layout:
     """
     A Layout manages the static information about the game board.
@@ -34,32 +52,52 @@ class Layout:
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
+        # The key of this layout in the per layout caches
+        self.cacheKey = '\n'.join(layoutText)
         self.totalFood = len(self.food.asList())
-        # self.initializeVisibilityMatrix()
+        self.bitFood = False
+        self.visibility = None
 
     def getNumGhosts(self):
         return self.numGhosts
 
+    def useBitFood(self):
+        """
+        Keeps the food in a BitGrid, so that game states on this layout copy,
+        count and hash their food in O(1). The walls stay a Grid: they are
+        never copied or hashed, and reading them is faster from lists.
+        """
+        self.food = BitGrid.fromGrid(self.food)
+        self.bitFood = True
+
     def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
-            for x in range(self.width):
-                for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
+        key = self.cacheKey
+        if key not in VISIBILITY_MATRIX_CACHE:
+            extents = layoutCache.load('visibility', self.layoutText)
+            if extents is None:
+                visibility = Visibility(self.walls)
+                layoutCache.store('visibility', self.layoutText, visibility.extents)
+            else:
+                visibility = Visibility(self.walls, extents)
+            VISIBILITY_MATRIX_CACHE[key] = visibility
+        self.visibility = VISIBILITY_MATRIX_CACHE[key]
+
+    def getVisibility(self):
+        """
+        Returns the Visibility of this layout, working it out on first use.
+        """
+        if self.visibility is None:
+            self.initializeVisibilityMatrix()
+        return self.visibility
+
+    def getStructure(self):
+        """
+        Returns the LayoutStructure of this layout, shared by every copy of it.
+        """
+        key = self.cacheKey
+        if key not in LAYOUT_STRUCTURE_CACHE:
+            LAYOUT_STRUCTURE_CACHE[key] = LayoutStructure(self)
+        return LAYOUT_STRUCTURE_CACHE[key]
 
     def isWall(self, pos):
         x, col = pos
@@ -84,13 +122,22 @@ class Layout:
 
     def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
         row, col = [int(x) for x in pacPos]
-        return ghostPos in self.visibility[row][col][pacDirection]
+        return self.getVisibility().isVisible((row, col), pacDirection, ghostPos)
 
     def __str__(self):
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        """
+        Copies the layout without parsing it again. The walls never change,
+        so the copy shares them.
+        """
+        layout = copy.copy(self)
+        layout.food = self.food.copy()
+        layout.capsules = self.capsules[:]
+        layout.agentPositions = self.agentPositions[:]
+        layout.layoutText = self.layoutText[:]
+        return layout
 
     def processLayoutText(self, layoutText):
         """
@@ -128,19 +175,136 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
+
+class Visibility:
+    """
+    Lines of sight along the corridors of a layout.
+
+    extents[direction][x][y] is how many open cells there are in a row
+    from (x, y) in that direction, up to the first wall (0 for walls and
+    for STOP). Whether a position can be seen from a cell looking one way
+    is then a comparison, however far away it is.
+    """
+    DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+    def __init__(self, walls, extents=None):
+        self.width = walls.width
+        self.height = walls.height
+        if extents is None:
+            extents = self._rayExtents(walls)
+        self.extents = extents
+
+    def _rayExtents(self, walls):
+        width, height = walls.width, walls.height
+        def isWall(x, y):
+            return x < 0 or y < 0 or x >= width or y >= height or walls[x][y]
+        extents = {Directions.STOP: [[0] * height for x in range(width)]}
+        for direction in Visibility.DIRECTIONS:
+            dx, dy = Actions.directionToVector(direction)
+            dx, dy = int(dx), int(dy)
+            extent = [[0] * height for x in range(width)]
+            # Work back from the far end of each row or column, so that every
+            # cell can add one to the cell beyond it
+            xs = range(width)
+            ys = range(height)
+            if dx > 0: xs.reverse()
+            if dy > 0: ys.reverse()
+            for x in xs:
+                for y in ys:
+                    if walls[x][y] or isWall(x + dx, y + dy): continue
+                    extent[x][y] = extent[x + dx][y + dy] + 1
+            extents[direction] = extent
+        return extents
+
+    def _offset(self, pos, direction, target):
+        # How far target is from pos in the given direction, or None if
+        # it is not straight that way
+        if direction not in self.extents or direction == Directions.STOP: return None
+        x, y = pos
+        dx, dy = Actions.directionToVector(direction)
+        if dx == 0:
+            if target[0] != x: return None
+            return (target[1] - y) * dy
+        if target[1] != y: return None
+        return (target[0] - x) * dx
+
+    def inFront(self, pos, direction, target):
+        """
+        Whether the cell target is straight ahead of the cell pos, looking in
+        direction, with no wall in between.
+        """
+        offset = self._offset(pos, direction, target)
+        if offset is None or offset != int(offset): return False
+        return 1 <= offset <= self.extents[direction][int(pos[0])][int(pos[1])]
+
+    def isVisible(self, pos, direction, target):
+        """
+        Like inFront, but target may also be half way between two cells.
+        """
+        offset = self._offset(pos, direction, target)
+        if offset is None or 2 * offset != int(2 * offset): return False
+        return 0 < offset <= self.extents[direction][int(pos[0])][int(pos[1])]
+
+class LayoutStructure:
+    """
+    What follows from the walls and initial food of a layout, worked out
+    once per layout (see Layout.getStructure):
+
+      wallBits, foodBits - the walls and the initial food, as BitGrids
+      wallSet, wallList  - the positions of the walls, as a frozenset and
+                           as a tuple column by column
+      cells              - the open cells, column by column
+      index              - the number of each open cell in cells
+      neighbours[i]      - the numbers of the open cells next to cell i
+      kinds[i]           - DEAD_END if there is at most one way out of cell
+                           i, CORRIDOR if there are two, JUNCTION otherwise
+    """
+    def __init__(self, layout):
+        self.width = layout.width
+        self.height = layout.height
+        self.wallBits = BitGrid.fromGrid(layout.walls)
+        if isinstance(layout.food, BitGrid):
+            self.foodBits = layout.food.copy()
+        else:
+            self.foodBits = BitGrid.fromGrid(layout.food)
+        walls = layout.walls
+        self.wallList = tuple(walls.asList())
+        self.wallSet = frozenset(self.wallList)
+        self.cells = [(x, y) for x in range(self.width) for y in range(self.height) if not walls[x][y]]
+        self.index = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.neighbours = []
+        for x, y in self.cells:
+            self.neighbours.append([self.index[cell] for cell in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+                                    if cell in self.index])
+        self.kinds = []
+        for neighbours in self.neighbours:
+            if len(neighbours) <= 1: self.kinds.append(DEAD_END)
+            elif len(neighbours) == 2: self.kinds.append(CORRIDOR)
+            else: self.kinds.append(JUNCTION)
+
 def getLayout(name, back = 2):
-    if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
-    else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back -1)
-        os.chdir(curdir)
-    return layout
+    """
+    Returns the layout called name, looking for it in layouts/ and in the
+    current directory, and then in up to back + 1 directories above.
+
+    Each layout file is only parsed once per process; every call returns a
+    copy of it.
+    """
+    path = findLayout(name, back)
+    if path == None: return None
+    key = (path, os.path.getmtime(path))
+    if key not in LAYOUT_REGISTRY:
+        LAYOUT_REGISTRY[key] = tryToLoad(path)
+    return LAYOUT_REGISTRY[key].deepCopy()
+
+def findLayout(name, back = 2):
+    if not name.endswith('.lay'): name += '.lay'
+    prefix = ''
+    for i in range(back + 2):
+        for path in [os.path.join(prefix, 'layouts', name), os.path.join(prefix, name)]:
+            if os.path.exists(path): return os.path.abspath(path)
+        prefix = os.path.join('..', prefix)
+    return None
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
@@ -0,0 +1,69 @@
+# layoutCache.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+# An on-disk cache for tables that are expensive to compute but depend
+# only on the layout, so that they survive from one run to the next.
+#
+# Entries are pickles named by what they hold and by a hash of the
+# layout text, so editing a .lay file simply misses the cache.
+
+import os
+import hashlib
+import cPickle
+
+# Where the cache lives. Set to None to turn the disk cache off.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.layoutcache')
+
+def layoutHash(layoutText):
+    """
+    Returns a hex digest of the layout text (a list of row strings).
+    """
+    return hashlib.sha1('\n'.join(layoutText)).hexdigest()
+
+def cachePath(kind, layoutText):
+    return os.path.join(CACHE_DIR, '%s-%s.pkl' % (kind, layoutHash(layoutText)))
+
+def load(kind, layoutText):
+    """
+    Returns the cached value of the given kind for the layout, or None if
+    there is none (or it cannot be read).
+    """
+    if CACHE_DIR is None: return None
+    path = cachePath(kind, layoutText)
+    if not os.path.exists(path): return None
+    try:
+        f = open(path, 'rb')
+        try: return cPickle.load(f)
+        finally: f.close()
+    except Exception:
+        return None
+
+def store(kind, layoutText, value):
+    """
+    Saves value in the cache. Failing to write the cache is not an error.
+    """
+    if CACHE_DIR is None: return
+    path = cachePath(kind, layoutText)
+    # Write to a temporary file first, so that a reader in another
+    # process never sees half a pickle.
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        f = open(tmpPath, 'wb')
+        try: cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+        finally: f.close()
+        os.rename(tmpPath, path)
+    except (IOError, OSError):
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
@@ -0,0 +1,266 @@
+# mazeDistances.py
+# ----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+# Shortest path lengths through the maze between every pair of open
+# cells, and the ones a ghost has to take, computed once per layout.
+
+from array import array
+from collections import deque
+from game import Directions
+import api
+import layoutCache
+
+# Marks a pair of cells with no path between them in the table.
+UNREACHABLE = 0xFFFF
+
+# Tables already loaded in this process, keyed by layout text.
+MAZE_DISTANCES_CACHE = {}
+GHOST_DISTANCES_CACHE = {}
+
+# The directions a ghost can be heading in, numbered in this order in
+# GhostDistances, and the number of the opposite of each.
+HEADINGS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+REVERSE_HEADINGS = [1, 0, 3, 2]
+
+def getMazeDistances(state):
+    """
+    Returns the MazeDistances for the layout being played in state.
+
+    The table is looked for in this process first, then in the disk
+    cache, and only computed if neither has it.
+    """
+    layoutText = api.layoutText(state)
+    key = '\n'.join(layoutText)
+    if key not in MAZE_DISTANCES_CACHE:
+        cached = layoutCache.load('distances', layoutText)
+        if cached is not None:
+            cells, table = cached
+            distances = MazeDistances(cells, array('H', table))
+        else:
+            distances = MazeDistances(openCells(api.wallSet(state), api.corners(state)))
+            layoutCache.store('distances', layoutText, (distances.cells, distances.table.tostring()))
+        MAZE_DISTANCES_CACHE[key] = distances
+    return MAZE_DISTANCES_CACHE[key]
+
+def getGhostDistances(state):
+    """
+    Returns the GhostDistances for the layout being played in state. It
+    is kept for the rest of the process, but not on disk, as its rows are
+    only worked out as ghosts get to them.
+    """
+    key = '\n'.join(api.layoutText(state))
+    if key not in GHOST_DISTANCES_CACHE:
+        GHOST_DISTANCES_CACHE[key] = GhostDistances(getMazeDistances(state))
+    return GHOST_DISTANCES_CACHE[key]
+
+def openCells(walls, corners):
+    """
+    Returns the non-wall cells of the board, column by column.
+    """
+    walls = set(walls)
+    width = corners[1][0] - corners[0][0] + 1
+    height = corners[2][1] - corners[0][1] + 1
+    return [(x, y) for x in range(width) for y in range(height) if (x, y) not in walls]
+
+class MazeDistances:
+    """
+    All-pairs shortest path lengths between the open cells of a layout.
+
+    Open cells are numbered in the order of cells; the distance from
+    cell i to cell j is table[i * numCells + j], stored as unsigned
+    shorts. The table is computed by a BFS from every cell unless it is
+    passed in.
+
+    Positions passed in are truncated to the cell they are in, the way
+    the ghost positions are elsewhere in the agent.
+
+    The maze itself is kept as well: moves[direction][i] is the cell one
+    step from cell i in that direction (None for a wall), and
+    neighbours[i] lists the open cells next to cell i.
+    """
+
+    def __init__(self, cells, table=None):
+        self.cells = cells
+        self.numCells = len(cells)
+        self.index = dict((cell, i) for i, cell in enumerate(cells))
+        self.moves = {}
+        for direction, (dx, dy) in [(Directions.WEST, (-1, 0)), (Directions.EAST, (1, 0)),
+                                    (Directions.SOUTH, (0, -1)), (Directions.NORTH, (0, 1))]:
+            self.moves[direction] = [self.index.get((x + dx, y + dy)) for x, y in cells]
+        self.neighbours = []
+        for i in range(self.numCells):
+            self.neighbours.append([self.moves[d][i] for d in [Directions.WEST, Directions.EAST, Directions.SOUTH, Directions.NORTH]
+                                    if self.moves[d][i] is not None])
+        if table is None:
+            table = self._allPairs()
+        self.table = table
+
+        n = self.numCells
+        self.eccentricities = []
+        for i in range(n):
+            reachable = [d for d in table[i * n:(i + 1) * n] if d != UNREACHABLE]
+            self.eccentricities.append(max(reachable))
+
+    def _allPairs(self):
+        n = self.numCells
+        neighbours = self.neighbours
+        table = array('H', [UNREACHABLE]) * (n * n)
+        for source in range(n):
+            offset = source * n
+            table[offset + source] = 0
+            queue = deque([source])
+            while queue:
+                i = queue.popleft()
+                distance = table[offset + i] + 1
+                for j in neighbours[i]:
+                    if table[offset + j] == UNREACHABLE:
+                        table[offset + j] = distance
+                        queue.append(j)
+        return table
+
+    def cellId(self, pos):
+        """
+        Returns the number of the open cell pos is in, or None for a wall.
+        """
+        x, y = pos
+        return self.index.get((int(x), int(y)))
+
+    def distance(self, a, b):
+        """
+        Returns the maze distance between positions a and b, or infinity
+        if either is a wall or there is no path.
+        """
+        i = self.cellId(a)
+        j = self.cellId(b)
+        if i is None or j is None: return float('inf')
+        distance = self.table[i * self.numCells + j]
+        if distance == UNREACHABLE: return float('inf')
+        return distance
+
+    def row(self, a):
+        """
+        Returns the distances from position a to every open cell, indexed
+        by cell number, with UNREACHABLE where there is no path.
+        """
+        i = self.cellId(a)
+        if i is None: return array('H', [UNREACHABLE]) * self.numCells
+        return self.table[i * self.numCells:(i + 1) * self.numCells]
+
+    def eccentricity(self, a):
+        """
+        Returns the distance from position a to the furthest cell it can
+        reach, or 0 if a is a wall.
+        """
+        i = self.cellId(a)
+        if i is None: return 0
+        return self.eccentricities[i]
+
+class GhostDistances:
+    """
+    How far a ghost has to go to get to each open cell of a layout, given
+    where it is and which way it is heading, when it may never turn back.
+
+    A ghost may reach a cell heading several ways, each at its own
+    distance, so the distances are kept per state: an open cell i
+    (numbered as in the MazeDistances) and the heading HEADINGS[h] the
+    ghost entered it in. Only the states a ghost can move into are
+    numbered, those where the cell it came from is open: two or three
+    per cell in a maze rather than four. cellOf[s] is the cell of state s.
+
+    The distances from a ghost at a cell heading some way are worked out
+    by a BFS the first time it is asked for, and kept: row() gives the
+    distance to every other state, furthestDistance() the longest of them.
+    """
+
+    def __init__(self, distances):
+        self.distances = distances
+        moves = [distances.moves[heading] for heading in HEADINGS]
+        self.moves = moves
+        states = [(i, h) for i in range(distances.numCells) for h in range(len(HEADINGS))
+                  if moves[REVERSE_HEADINGS[h]][i] is not None]
+        self.numStates = len(states)
+        self.stateIds = dict((state, s) for s, state in enumerate(states))
+        self.cellOf = array('i', [i for i, h in states])
+        # next[s] lists the states one move on from state s
+        self.next = [self._successors(i, h) for i, h in states]
+        self.rows = {}
+
+    def _successors(self, i, h):
+        """
+        Returns the states a ghost at cell i heading HEADINGS[h] can move
+        into next.
+        """
+        return [self.stateIds[(self.moves[g][i], g)] for g in range(len(HEADINGS))
+                if g != REVERSE_HEADINGS[h] and self.moves[g][i] is not None]
+
+    def _search(self, i, h):
+        """
+        Returns the distances from a ghost at cell i heading HEADINGS[h] to
+        every state, and the longest of them.
+
+        The ghost's own state is left out. It may not be one a move gets
+        to, when the ghost has turned half way through a step, so the
+        search starts from the states one move on.
+        """
+        table = array('H', [UNREACHABLE]) * self.numStates
+        nextStates = self.next
+        furthest = 0
+        queue = deque()
+        # Marked as found, so that the ghost does not come back to it
+        start = self.stateIds.get((i, h))
+        if start is not None:
+            table[start] = 0
+        for s in self._successors(i, h):
+            if table[s] == UNREACHABLE:
+                table[s] = 1
+                queue.append(s)
+        while queue:
+            s = queue.popleft()
+            furthest = table[s]
+            distance = furthest + 1
+            for t in nextStates[s]:
+                if table[t] == UNREACHABLE:
+                    table[t] = distance
+                    queue.append(t)
+        if start is not None:
+            table[start] = UNREACHABLE
+        return table, furthest
+
+    def _row(self, pos, direction):
+        i = self.distances.cellId(pos)
+        if i is None or direction not in HEADINGS: return None
+        key = (i, HEADINGS.index(direction))
+        if key not in self.rows:
+            self.rows[key] = self._search(*key)
+        return self.rows[key]
+
+    def row(self, pos, direction):
+        """
+        Returns the distances from a ghost at pos heading in direction to
+        every other state, indexed by state number, or None for a wall or a
+        ghost that is not heading anywhere. The ghost's own cell, at
+        distance 0, is left to the caller.
+        """
+        row = self._row(pos, direction)
+        if row is None: return None
+        return row[0]
+
+    def furthestDistance(self, pos, direction):
+        """
+        Returns how far the ghost at pos heading in direction can get
+        without turning back, or 0 if it is at a wall or not heading
+        anywhere.
+        """
+        row = self._row(pos, direction)
+        if row is None: return 0
+        return row[1]
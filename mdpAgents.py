@@ -35,22 +35,54 @@ import random
 import game
 import util
 import time
+import mdpSolvers
+import mazeDistances
+import moveProfiler
+from policyCache import PolicyCache
+import layoutCache
 from collections import deque
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 """ Class to represent the grid of the game 
 
 Contains the utility grid and reward grid for the game
 
 Varies the rewards based on a number of rules
 
+Rewards are worked out in self.rewards, a flat list with one entry per open
+cell (numbered as in distances), and each rule adds a whole field to it.
+They are copied into reward_grid once they are done.
+
 """
 
+# Multipliers for the reward of a square by the number of walls around it,
+# for positive and negative rewards
+POSITIVE_SQUARE_MULTIPLIERS = [1, 0.8, 0.6, 0.2, 1]
+NEGATIVE_SQUARE_MULTIPLIERS = [1, 5.0/4, 5.0/3, 5, 1]
+
+# Per layout multipliers, keyed by the MazeDistances of the layout
+SQUARE_MULTIPLIER_CACHE = {}
+
+""" Get the multipliers of every open cell, for positive and negative rewards """
+def getSquareMultipliers(distances):
+    if distances not in SQUARE_MULTIPLIER_CACHE:
+        numOfWalls = [4 - len(neighbours) for neighbours in distances.neighbours]
+        SQUARE_MULTIPLIER_CACHE[distances] = ([POSITIVE_SQUARE_MULTIPLIERS[n] for n in numOfWalls],
+                                              [NEGATIVE_SQUARE_MULTIPLIERS[n] for n in numOfWalls])
+    return SQUARE_MULTIPLIER_CACHE[distances]
+
+# Grid attributes that are the same for every move on a layout, which copies
+# of a grid share instead of copying
+LAYOUT_TABLES = ['distances', 'ghostDistances', 'cells', 'index']
+
 class Grid:
-    def __init__(self, width, height, walls, food, capsules, ghostsWithLastDirection, pacmanPos, ghostStatesWithTimer, ghostSpawnPositions):
+    def __init__(self, width, height, walls, food, capsules, ghostsWithLastDirection, pacmanPos, ghostStatesWithTimer, ghostSpawnPositions, distances, ghostDistances, profiler=moveProfiler.NullProfiler()):
         self.width = width
         self.height = height
-        self.utility_grid = [[0 for _ in range(width)] for _ in range(height)]
-        self.reward_grid = [[-20 for _ in range(width)] for _ in range(height)] 
         self.ghostReward = -250
         self.foodReward = (-self.ghostReward * 0.9) / float(len(food))
         self.capsuleReward = 200
@@ -66,6 +98,10 @@ class Grid:
         self.edibleGhosts = []
         self.pacmanPoweredUp = False
         self.food = food
+        self.distances = distances
+        self.ghostDistances = ghostDistances
+        self.cells = distances.cells
+        self.index = distances.index
 
         for ghost in ghostsWithLastDirection:
             self.ghosts.append(ghost['pos'])
@@ -73,24 +109,14 @@ class Grid:
         for ghost in ghostStatesWithTimer:
             if ghost[1] > 1:
                 self.edibleGhosts.append(ghost[0])
-        
-        
-        for x in range(width):
-            for y in range(height):
-                if (x, y) in food:
-                        self.updateReward((x, y), self.foodReward)   
-                elif (x, y) in walls:
-                    self.updateUtility((x, y), '#')      
-                    self.updateReward((x, y), '#') 
-        
-        # Higher negative rewards for coords with more walls around them
-        for x in range(width):
-            for y in range(height):
-                if (x, y) not in self.walls:
-                    self.updateSquareReward((x, y))
-        
 
+        profiler.phase('squareRewards')
+        self.rewards = [self.foodReward if cell in food else -20 for cell in self.cells]
+
+        # Higher negative rewards for coords with more walls around them
+        self.updateSquareRewards()
 
+        profiler.phase('ghostRewards')
         firstStep = False
         for ghost in ghostsWithLastDirection:
             if ghost['dir'] == Directions.STOP:
@@ -119,164 +145,111 @@ class Grid:
                 else:
                     self.updateNeighboursRewards(ghost, 1)    
 
+        profiler.phase('capsuleRewards')
         self.updateCapsuleRewards()
+        profiler.phase('foodRewards')
         self.addFoodDistanceRewards()
 
+        profiler.phase('gridRows')
+        self.reward_grid = self.toRows(self.rewards)
+        self.utility_grid = self.toRows([0] * len(self.cells))
+
+    """ Copy everything but the per layout tables, which the copy shares """
+    def __deepcopy__(self, memo):
+        other = copy.copy(self)
+        memo[id(self)] = other
+        for name, value in self.__dict__.items():
+            if name not in LAYOUT_TABLES:
+                other.__dict__[name] = copy.deepcopy(value, memo)
+        return other
+
+    """ Lay out a list of values, one per open cell, as rows of the grid with '#' for walls """
+    def toRows(self, values):
+        rows = [['#'] * self.width for _ in range(self.height)]
+        for (x, y), value in zip(self.cells, values):
+            rows[self.height - y - 1][x] = value
+        return rows
+
+    """ Add a field of rewards, one per open cell, to the rewards """
+    def addField(self, field):
+        self.rewards = [reward + extra for reward, extra in zip(self.rewards, field)]
+
     """ Add rewards to the grid based on the distance from the food to incentivise Pacman to eat food """
     def addFoodDistanceRewards(self):
+        # One BFS from all the food at once gives the distance to the nearest food
+        foodDistance = [None] * len(self.cells)
         queue = deque()
         for food in self.food:
-            queue.append((food, 0))
-        visited = set()
+            i = self.index[food]
+            foodDistance[i] = 0
+            queue.append(i)
+        neighbours = self.distances.neighbours
         while queue:
-            pos, distance = queue.popleft()
-            x, y = pos
-            if pos in visited or pos in self.walls or x < 0 or x >= self.width or y < 0 or y >= self.height:
-                continue
-            visited.add(pos)
-            self.updateReward(pos, self.getReward(pos) + (0.8 * self.foodReward * (1 - (float(distance) / self.furthestDistance))))
-            queue.append(((x - 1, y), distance + 1))
-            queue.append(((x + 1, y), distance + 1))
-            queue.append(((x, y - 1), distance + 1))
-            queue.append(((x, y + 1), distance + 1))
+            i = queue.popleft()
+            for j in neighbours[i]:
+                if foodDistance[j] is None:
+                    foodDistance[j] = foodDistance[i] + 1
+                    queue.append(j)
+
+        scale = 0.8 * self.foodReward
+        furthestDistance = float(self.furthestDistance)
+        self.addField([0 if distance is None else scale * (1 - (distance / furthestDistance)) for distance in foodDistance])
 
     """ Get the distance between two positions """
     def getDistanceBetween(self, pos1, pos2):
-        x, y = pos2
-        pos2 = (int(x), int(y))
-        queue = deque([(pos1, 0)])
-        visited = set()
-        while queue:
-            pos, distance = queue.popleft()
-            x, y = pos
-            if pos in visited or pos in self.walls or x < 0 or x >= self.width or y < 0 or y >= self.height:
-                continue
-            visited.add(pos)
-            if pos == pos2:
-                return distance
-            queue.append(((x - 1, y), distance + 1))
-            queue.append(((x + 1, y), distance + 1))
-            queue.append(((x, y - 1), distance + 1))
-            queue.append(((x, y + 1), distance + 1))
-        
-        return float('inf')
+        return self.distances.distance(pos1, pos2)
 
     """ Apply negative rewards to the spawn positions of the ghosts """
     def applyNegativeRewardToGhostSpawn(self, ghostSpawnPositions):
         for ghost in ghostSpawnPositions:
-            x, y = ghost
-            self.updateReward(ghost, self.getReward(ghost) + (10 * self.ghostReward))
-            if (x - 1, y) not in self.walls:
-                self.updateReward((x - 1, y), self.getReward((x - 1, y)) + (10 * self.ghostReward))
-            if (x + 1, y) not in self.walls:
-                self.updateReward((x + 1, y), self.getReward((x + 1, y)) + (10 * self.ghostReward))
-            if (x, y - 1) not in self.walls:
-                self.updateReward((x, y - 1), self.getReward((x, y - 1)) + (10 * self.ghostReward))
-            if (x, y + 1) not in self.walls:
-                self.updateReward((x, y + 1), self.getReward((x, y + 1)) + (10 * self.ghostReward))
-            
+            i = self.index[ghost]
+            for j in [i] + self.distances.neighbours[i]:
+                self.rewards[j] += 10 * self.ghostReward
 
     """ Update the rewards for the capsules based on the distance of the ghosts from the pacman """
     def updateCapsuleRewards(self):
         if self.pacmanPoweredUp:
             for capsule in self.capsules:
-                self.updateReward(capsule, self.getReward(capsule) + (self.ghostReward * 0.2))
+                self.rewards[self.index[capsule]] += self.ghostReward * 0.2
             return
-        queue = deque([(self.pacmanPos, 0)])
-        visited = set()
+        # Goes by the furthest ghost within pacmanAura. Ghosts between two cells don't count
         capsuleReward = 0
-        while queue:
-            pos, distance = queue.popleft()
-            x, y = pos
-            if pos in visited or pos in self.walls or x < 0 or x >= self.width or y < 0 or y >= self.height or distance > self.pacmanAura:
-                continue
-            visited.add(pos)
-            if pos in self.ghosts:
-                capsuleReward = (1 - (float(distance) / self.pacmanAura)) * self.highestCapsuleReward
-            queue.append(((x - 1, y), distance + 1))
-            queue.append(((x + 1, y), distance + 1))
-            queue.append(((x, y - 1), distance + 1))
-            queue.append(((x, y + 1), distance + 1))
+        nearGhosts = [self.getDistanceBetween(self.pacmanPos, ghost) for ghost in self.ghosts if ghost[0] == int(ghost[0]) and ghost[1] == int(ghost[1])]
+        nearGhosts = [distance for distance in nearGhosts if distance <= self.pacmanAura]
+        if nearGhosts:
+            capsuleReward = (1 - (float(max(nearGhosts)) / self.pacmanAura)) * self.highestCapsuleReward
         
         for capsule in self.capsules:
-            self.updateReward(capsule, self.getReward(capsule) + capsuleReward)
-
-
-    def updateSquareReward(self, coord):
-        x, y = coord
-        numOfWalls = 0
-        if (x - 1, y) in self.walls:
-            numOfWalls += 1
-        if (x + 1, y) in self.walls:
-            numOfWalls += 1
-        if (x, y - 1) in self.walls:
-            numOfWalls += 1
-        if (x, y + 1) in self.walls:
-            numOfWalls += 1
-        
-        reward = self.getReward(coord)
-        if numOfWalls == 3:
-            if reward > 0:
-                self.updateReward(coord, reward * 0.2)
-            else:
-                self.updateReward(coord, reward * 5)
-        elif numOfWalls == 2:
-            if reward > 0:
-                self.updateReward(coord, reward * 0.6)
-            else:
-                self.updateReward(coord, reward * (5.0/3))
-        elif numOfWalls == 1:
-            if reward > 0:
-                self.updateReward(coord, reward * 0.8)
-            else:
-                self.updateReward(coord, reward * (5.0/4))
-    
+            self.rewards[self.index[capsule]] += capsuleReward
+
+    """ Scale every reward by the multiplier for the number of walls around its square """
+    def updateSquareRewards(self):
+        positive, negative = getSquareMultipliers(self.distances)
+        self.rewards = [reward * (positive[i] if reward > 0 else negative[i]) for i, reward in enumerate(self.rewards)]
+
     """ Get the furthest distance any object can travel from a given position without repeating steps """
     def getFurthestDistance(self, ghost):
-        visited = set()
-        furthestDistance = 10
-        x, y = ghost['pos']
-        x, y = int(x), int(y)
-        initialqueue = deque([((x, y), ghost['dir'], 0)])
-
-        dirToCheck = {
-            Directions.NORTH: [Directions.NORTH, Directions.EAST, Directions.WEST],
-            Directions.SOUTH: [Directions.SOUTH, Directions.EAST, Directions.WEST],
-            Directions.EAST: [Directions.EAST, Directions.NORTH, Directions.SOUTH],
-            Directions.WEST: [Directions.WEST, Directions.NORTH, Directions.SOUTH]
-        }
+        self.furthestDistance = max(10, self.ghostDistances.furthestDistance(ghost['pos'], ghost['dir']))
 
-        while initialqueue:
-            pos, dir, distance = initialqueue.popleft()
-            x, y = pos
-            if (pos, dir) in visited or pos in self.walls or x < 0 or x >= self.width or y < 0 or y >= self.height:
-                continue
-            visited.add((pos, dir))
-
-            furthestDistance = max(furthestDistance, distance)
-            for d in dirToCheck[dir]:
-                next_pos = self.get_next_position(pos, d)
-                if next_pos != pos:
-                    initialqueue.append((next_pos, d, distance + 1))
-                    
-        self.furthestDistance = furthestDistance
+    """ The negative reward for a square a given number of steps from a ghost, for every number of steps up to furthest """
+    def getGhostFalloff(self, furthest, multiplier):
+        falloff = []
+        for distance in range(furthest + 1):
+            if distance > self.ghostAura:
+                fraction = (1 - (float(distance) / self.furthestDistance)) * self.rateIfNotCloser
+            else:
+                if distance <= 1:
+                    fraction = 2
+                else:
+                    fraction = (1 - (float(distance) / (self.ghostAura + 1)))
+            falloff.append(fraction * self.ghostReward * multiplier)
+        return falloff
 
     """ The closer a square is to a ghost, the higher the negative reward """
     def updateNeighboursRewards(self, ghost, multiplier):
         x, y = ghost['pos']
         x, y = int(x), int(y)
 
-        direction = ghost['dir']
-        visited = set()
-        queue = deque([((x, y), direction, 0)])
-
-        dirToCheck = {
-            Directions.NORTH: [Directions.NORTH, Directions.EAST, Directions.WEST],
-            Directions.SOUTH: [Directions.SOUTH, Directions.EAST, Directions.WEST],
-            Directions.EAST: [Directions.EAST, Directions.NORTH, Directions.SOUTH],
-            Directions.WEST: [Directions.WEST, Directions.NORTH, Directions.SOUTH]
-        }
-
         opposite = {
             Directions.NORTH: Directions.SOUTH,
             Directions.SOUTH: Directions.NORTH,
@@ -284,74 +257,66 @@ class Grid:
             Directions.WEST: Directions.EAST
         }
 
-        bx, by = self.get_next_position((x, y), opposite[direction])
-        if (bx, by) not in self.walls:
-            self.updateReward((bx, by), (self.getReward((bx, by)) + (2 * self.ghostReward * multiplier)))
-
-        while queue:
-            pos, dir, distance = queue.popleft()
-            x, y = pos
-            if (pos, dir) in visited or pos in self.walls or x < 0 or x >= self.width or y < 0 or y >= self.height:
-                continue
-            visited.add((pos, dir))
-
-            if distance > self.ghostAura:
-                fraction = (1 - (float(distance) / self.furthestDistance)) * self.rateIfNotCloser
-            else:
-                if distance <= 1:
-                    fraction = 2
-                else:
-                    fraction = (1 - (float(distance) / (self.ghostAura + 1)))
-
-            self.updateReward(pos, (self.getReward(pos) + (fraction * self.ghostReward * multiplier)))
-
-            for d in dirToCheck[dir]:
-                next_pos = self.get_next_position(pos, d)
-                if next_pos != pos and (next_pos, d) not in visited and next_pos not in self.walls:
-                    queue.append((next_pos, d, distance + 1))
+        behind = self.index.get(self.get_next_position((x, y), opposite[ghost['dir']]))
+
+        # A square is counted once for every direction the ghost can reach it in.
+        # The distances come from a table kept for the layout (see
+        # GhostDistances in mazeDistances.py), so all that is left is to look
+        # up the reward for each distance and add them up by square
+        squares = []
+        weights = []
+        if behind is not None:
+            squares.append(behind)
+            weights.append(2 * self.ghostReward * multiplier)
+        distances = self.ghostDistances.row(ghost['pos'], ghost['dir'])
+        if distances is not None:
+            falloff = self.getGhostFalloff(self.ghostDistances.furthestDistance(ghost['pos'], ghost['dir']), multiplier)
+            squares.append(self.distances.cellId(ghost['pos']))
+            weights.append(falloff[0])
+
+        if numpy is not None and distances is not None:
+            distances = numpy.frombuffer(distances, dtype=numpy.uint16)
+            states = numpy.nonzero(distances != mazeDistances.UNREACHABLE)[0]
+            cellOf = numpy.frombuffer(self.ghostDistances.cellOf, dtype=numpy.intc)
+            squares = numpy.concatenate((numpy.array(squares, dtype=numpy.intc), cellOf[states]))
+            weights = numpy.concatenate((weights, numpy.take(falloff, distances[states])))
+            field = numpy.bincount(squares, weights, len(self.cells)).tolist()
+        else:
+            field = [0] * len(self.cells)
+            for i, weight in zip(squares, weights):
+                field[i] += weight
+            if distances is not None:
+                cellOf = self.ghostDistances.cellOf
+                unreachable = mazeDistances.UNREACHABLE
+                for state, distance in enumerate(distances):
+                    if distance != unreachable:
+                        field[cellOf[state]] += falloff[distance]
+
+        self.addField(field)
     
     """ Initial furthest distance """
     def firstGetFurthestDistance(self, ghost):
-        visited = set()
-        furthestDistance = 0
-        initialqueue = deque([(ghost, 0)])
-        while initialqueue:
-            pos, distance = initialqueue.popleft()
-            x, y = pos
-            if pos in visited or pos in self.walls or x < 0 or x > self.width or y < 0 or y > self.height:
-                continue
-            visited.add(pos)
-            furthestDistance = max(furthestDistance, distance)
-            initialqueue.append(((x - 1, y), distance + 1))
-            initialqueue.append(((x + 1, y), distance + 1))
-            initialqueue.append(((x, y - 1), distance + 1))
-            initialqueue.append(((x, y + 1), distance + 1))
-        self.furthestDistance = furthestDistance
+        self.furthestDistance = self.distances.eccentricity(ghost)
 
     """ Initial update rewards for the first time without considering the direction of the ghosts """
     def firstUpdateNeighboursRewards(self, ghost):
-        x, y = ghost
-        x, y = int(x), int(y)
-        ghost = (x, y)
-        visited = set()
-        queue = deque([(ghost, 0)])
-        while queue:
-            pos, distance = queue.popleft()
-            x, y = pos
-            if pos in visited or pos in self.walls or x < 0 or x > self.width or y < 0 or y > self.height:
-                continue
-            visited.add(pos)
-            if distance > self.ghostAura:
+        unreachable = mazeDistances.UNREACHABLE
+        field = []
+        for distance in self.distances.row(ghost):
+            if distance == unreachable:
+                fraction = 0
+            elif distance > self.ghostAura:
                 fraction = (1 -  (float(distance) / self.furthestDistance)) * self.rateIfNotCloser
             else:
                 fraction = (1 -  (float(distance) / (self.ghostAura + 1)))
-       
-            self.updateReward(pos, self.getReward(pos) + (fraction * self.ghostReward))
-            queue.append(((x - 1, y), distance + 1))
-            queue.append(((x + 1, y), distance + 1))
-            queue.append(((x, y - 1), distance + 1))
-            queue.append(((x, y + 1), distance + 1))
+            field.append(fraction * self.ghostReward)
+
+        self.addField(field)
     
+    """ Start from the utilities of another grid of the same layout, e.g. the previous move's solution """
+    def seedUtilities(self, other):
+        self.utility_grid = [row[:] for row in other.utility_grid]
+
     def updateReward(self, pos, reward):
         x, y = pos
         self.reward_grid[self.height - int(y) - 1][int(x)] = reward
@@ -384,13 +349,86 @@ class Grid:
 
 import copy
 
+""" Read a yes/no option passed with -a, e.g. -a warmStart=True or just -a warmStart """
+def isSet(option):
+    return str(option).lower() in ['1', 'true', 'yes', 'on']
+
+# The share of the time the game allows for a move that the solve may use
+MOVE_TIME_SHARE = 0.8
+
 class MDPAgent(Agent):
-    def __init__(self):
+    # Solvers that can be picked with -a solver=...: the agent's own
+    # valueIteration, or one of the solvers in mdpSolvers.py
+    SOLVERS = ['loop'] + sorted(mdpSolvers.SOLVERS)
+
+    def __init__(self, solver='loop', warmStart=False, reportSweeps=False, profile=None,
+                 policyCache=0, policyEviction='lru', policyCacheFile=None, workers=None,
+                 evaluationSweeps=5, horizon=10, boundary='rewards', moveBudgetMs=None,
+                 ordering='cells'):
+        if solver not in MDPAgent.SOLVERS:
+            raise Exception('Unknown solver ' + str(solver) + ', expected one of ' + ', '.join(MDPAgent.SOLVERS))
+        self.solver = solver
+        # Prioritized sweeping only makes sense starting from the last solution
+        self.warmStart = isSet(warmStart) or solver == 'prioritized'
+        self.reportSweeps = isSet(reportSweeps)
+        # -a solver=parallel,workers=N splits each sweep across N processes
+        # (one per CPU by default)
+        self.workers = workers
+        # -a solver=modified,evaluationSweeps=K follows each Bellman sweep
+        # with K - 1 sweeps of the greedy policy
+        self.evaluationSweeps = int(evaluationSweeps)
+        # -a solver=local,horizon=H only solves the cells within H steps of
+        # Pacman, with boundary=rewards or boundary=previous for the values
+        # of the cells just beyond
+        self.horizon = int(horizon)
+        self.boundary = boundary
+        # -a solver=gaussSeidel,ordering=sources backs up the cells nearest
+        # the largest rewards first
+        self.ordering = ordering
+        # -a moveBudgetMs=T stops the solve early, with the best utilities
+        # found so far, if it would take more than T ms into the move. When
+        # the game enforces a time limit per move, the solve also stops in
+        # time for that (see setMoveTimeLimit)
+        self.moveBudget = None
+        if moveBudgetMs is not None:
+            self.moveBudget = float(moveBudgetMs) / 1000
+        self.moveTimeLimit = None
+        # The moves a solver chooses may depend on its options as well
+        self.solverKey = solver
+        if solver == 'modified':
+            self.solverKey = (solver, self.evaluationSweeps)
+        if solver == 'local':
+            self.solverKey = (solver, self.horizon, boundary)
+        if solver == 'gaussSeidel':
+            self.solverKey = (solver, ordering)
+        # -a profile=moves.jsonl appends the time taken by each phase of every move to moves.jsonl
+        if profile:
+            self.profiler = moveProfiler.MoveProfiler(profile)
+        else:
+            self.profiler = moveProfiler.NullProfiler()
+        # -a policyCache=N remembers the moves chosen in the last N situations
+        # and makes them again without solving when a situation repeats.
+        # policyCacheFile keeps the cache from one run to the next.
+        self.policyCache = None
+        self.policyCacheFile = policyCacheFile
+        if int(policyCache) > 0:
+            self.policyCache = PolicyCache(int(policyCache), policyEviction)
+            if policyCacheFile:
+                self.policyCache.load(policyCacheFile)
+        self.layoutKey = None
+        self.sweepCounts = []
+        self.solveTimes = []
+        self.residuals = []
+        self.arraySolver = None
+        self.transitionModel = None
+        self.distances = None
+        self.ghostDistances = None
         self.initialised = False
         self.width = 0
         self.height = 0
         self.grid = None
         self.discount = 0.8
+        self.epsilon = 0.01
         self.food = None
         self.capsules = None
         self.walls = None
@@ -400,6 +438,23 @@ class MDPAgent(Agent):
 
     
     def final(self, state):
+        if self.reportSweeps and self.sweepCounts:
+            moves = float(len(self.sweepCounts))
+            print "Sweeps: %d moves, %.2f per move, %.2f in total" % (moves, sum(self.sweepCounts) / moves, sum(self.sweepCounts))
+            print "Solver %s: %.2fms per move, %.2fs in total" % (self.solver, 1000 * sum(self.solveTimes) / moves, sum(self.solveTimes))
+            cutOff = [residual for residual in self.residuals if residual >= self.epsilon]
+            if cutOff:
+                print "Out of time: %d moves stopped short of convergence, largest residual %.4f" % (len(cutOff), max(cutOff))
+        if self.reportSweeps and self.policyCache is not None:
+            print "Policy cache: %d hits, %d misses, %d entries" % (self.policyCache.hits, self.policyCache.misses, len(self.policyCache))
+        if self.policyCache is not None and self.policyCacheFile:
+            self.policyCache.save(self.policyCacheFile)
+        if self.arraySolver is not None:
+            self.arraySolver.close()
+        self.sweepCounts = []
+        self.solveTimes = []
+        self.residuals = []
+        self.profiler.endGame()
         self.initialised = False
         self.grid = None
         self.food = None
@@ -408,8 +463,28 @@ class MDPAgent(Agent):
         self.ghosts = None
         self.ghostsWithLastDirection = []
         self.ghostsSpawnPositions = []
+        self.arraySolver = None
+        self.transitionModel = None
+        self.distances = None
+        self.ghostDistances = None
 
     
+    """ Called by the game, if it enforces a time limit on each move, with the limit in seconds """
+    def setMoveTimeLimit(self, seconds):
+        self.moveTimeLimit = seconds
+
+    """ The time by which the solve has to be done, or None if there is no hurry """
+    def getDeadline(self, moveStart):
+        budgets = []
+        if self.moveBudget is not None:
+            budgets.append(self.moveBudget)
+        if self.moveTimeLimit is not None:
+            # Leave some of the time for the rest of the move
+            budgets.append(self.moveTimeLimit * MOVE_TIME_SHARE)
+        if not budgets:
+            return None
+        return moveStart + min(budgets)
+
     def getWidthHeight(self, state):
         corners = api.corners(state)
         self.width = corners[1][0] - corners[0][0] + 1
@@ -418,11 +493,19 @@ class MDPAgent(Agent):
 
     def initialise(self, state):
         self.getWidthHeight(state)
-        self.food = set(api.food(state))
-        self.capsules = set(api.capsules(state))
-        self.walls = set(api.walls(state))
+        self.food = set(api.foodSet(state))
+        self.capsules = set(api.capsuleSet(state))
+        self.walls = api.wallSet(state)
         self.initialised = True
         self.ghostsSpawnPositions = api.ghosts(state)
+        self.distances = mazeDistances.getMazeDistances(state)
+        self.ghostDistances = mazeDistances.getGhostDistances(state)
+        self.layoutKey = layoutCache.layoutHash(api.layoutText(state))
+        if self.solver != 'loop':
+            self.transitionModel = mdpSolvers.getTransitionModel(state)
+            self.arraySolver = mdpSolvers.makeSolver(self.solver, self.transitionModel, self.workers,
+                                                     self.evaluationSweeps, self.horizon, self.boundary,
+                                                     self.ordering)
 
     """ Get the best direction to move in based on the current position and surrounding utilities"""
     def getBestHelper(self, state, pos, sameDirectionProb, differentDirectionProb):
@@ -451,17 +534,25 @@ class MDPAgent(Agent):
                 utility += self.grid.getUtility(other_pos) * differentDirectionProb
 
             
-            if utility > best_utility:
+            # Moves within rounding error of each other are a tie, which goes
+            # to the first direction whichever solver worked out the utilities
+            if best_direction is None or utility > best_utility + 1e-9 * max(1.0, abs(best_utility)):
                 best_utility = utility
                 best_direction = direction
 
         return best_direction, best_utility
     
     """ Value iteration algorithm """
-    def valueIteration(self, state, sameDirectionProb, differentDirectionProb, epsilon=0.01):
+    def valueIteration(self, state, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        sweeps = 0
         while True:
+            sweeps += 1
+            sweepStart = time.time()
             delta = 0 
-            new_grid = copy.deepcopy(self.grid) 
+            # Only the utilities change from sweep to sweep, so the rest of
+            # the grid is shared with the new one
+            new_grid = copy.copy(self.grid)
+            new_grid.seedUtilities(self.grid)
 
             for x in range(self.width):
                 for y in range(self.height):
@@ -478,12 +569,17 @@ class MDPAgent(Agent):
 
             self.grid = new_grid 
 
-            if delta < epsilon:
+            if delta < epsilon or mdpSolvers.outOfTime(deadline, sweepStart):
                 break
 
+        self.residual = delta
+        return sweeps
 
     
     def getAction(self, state):
+        deadline = self.getDeadline(time.time())
+        self.profiler.startMove()
+        self.profiler.phase('observe')
         if not self.initialised:
             self.initialise(state)
         pos = api.whereAmI(state)
@@ -520,14 +616,57 @@ class MDPAgent(Agent):
         
         ghostsStateWithTimer = api.ghostStatesWithTimes(state)
 
-        self.grid = Grid(self.width, self.height, self.walls, self.food, self.capsules, self.ghostsWithLastDirection, pos, ghostsStateWithTimer, self.ghostsSpawnPositions)
+        if self.policyCache is not None:
+            situation = self.getSituation(pos)
+            best_direction = self.policyCache.get(situation)
+            if best_direction is not None:
+                self.profiler.endMove(sweeps=0, cached=True)
+                return api.makeMove(best_direction, legal)
+
+        previousGrid = self.grid
+        self.grid = Grid(self.width, self.height, self.walls, self.food, self.capsules, self.ghostsWithLastDirection, pos, ghostsStateWithTimer, self.ghostsSpawnPositions, self.distances, self.ghostDistances, self.profiler)
+
+        self.profiler.phase('solve')
+        # Only a few rewards change from one move to the next, so last move's utilities are a good place to start
+        if self.warmStart and previousGrid is not None:
+            self.grid.seedUtilities(previousGrid)
+
+        start = time.time()
+        if self.arraySolver is not None:
+            sweeps = self.arraySolver.solve(self.grid, self.discount, sameDirectionProb, differentDirectionProb, self.epsilon, deadline)
+            residual = self.arraySolver.residual
+        else:
+            sweeps = self.valueIteration(state, sameDirectionProb, differentDirectionProb, self.epsilon, deadline)
+            residual = self.residual
+        self.solveTimes.append(time.time() - start)
 
-        self.valueIteration(state, sameDirectionProb, differentDirectionProb)
+        self.sweepCounts.append(sweeps)
+        self.residuals.append(residual)
+        if self.reportSweeps:
+            print "Move %d: %.2f sweeps in %.2fms%s" % (len(self.sweepCounts), sweeps, 1000 * self.solveTimes[-1],
+                                                        residual >= self.epsilon and ', out of time at residual %.4f' % residual or '')
 
+        self.profiler.phase('policy')
         best_direction, _ = self.getBestHelper(state, pos, sameDirectionProb, differentDirectionProb)
 
+        if self.policyCache is not None:
+            self.policyCache.put(situation, best_direction)
+
+        self.profiler.endMove(sweeps=sweeps, residual=float(residual))
         return api.makeMove(best_direction, legal)
 
+    """ Everything the choice of move depends on, as a key for the policy cache """
+    def getSituation(self, pos):
+        index = self.distances.index
+        food = 0
+        for cell in self.food:
+            food |= 1 << index[cell]
+        capsules = 0
+        for cell in self.capsules:
+            capsules |= 1 << index[cell]
+        ghosts = tuple([(g['pos'], g['dir'], g['timer']) for g in self.ghostsWithLastDirection])
+        return (self.layoutKey, self.solverKey, pos, ghosts, food, capsules)
+
     
     def get_next_position(self, current_pos, direction):
         x, y = current_pos
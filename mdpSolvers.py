@@ -0,0 +1,892 @@
+# mdpSolvers.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+# Array-backed solvers for the MDPAgent in mdpAgents.py.
+#
+# The agent's own valueIteration walks the board cell by cell. The
+# solvers here keep the rewards and utilities of the open (non-wall)
+# cells in flat arrays instead, so that a Bellman sweep is a handful of
+# whole-array operations.
+#
+# Every solver is made from a TransitionModel by makeSolver, and has
+#
+#   solve(grid, discount, sameDirectionProb, differentDirectionProb, epsilon, deadline)
+#
+# which solves the rewards in grid, starting from the utilities already
+# in it, writes the utilities back and returns the number of iterations
+# it took, and close(), which frees anything the solver holds on to.
+#
+# deadline, if given, is a time.time() by which the solve should be
+# done. A solver that would run past it stops early with the utilities
+# of its last complete iteration. Either way, it leaves in residual how
+# far those were from convergence: the largest change the last Bellman
+# backup made, which is below epsilon unless the solve stopped early.
+
+from game import Directions
+from game import Actions
+import api
+import multiprocessing
+import time
+import util
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The actions are tried in the same order as MDPAgent.getBestHelper, so
+# that ties are broken the same way.
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+# The two perpendicular moves Pacman may slip into for each action.
+SLIPS = {
+    Directions.NORTH: (Directions.EAST, Directions.WEST),
+    Directions.SOUTH: (Directions.EAST, Directions.WEST),
+    Directions.EAST: (Directions.NORTH, Directions.SOUTH),
+    Directions.WEST: (Directions.NORTH, Directions.SOUTH)
+}
+
+# Transition models already built, keyed by layout text. The walls never
+# change during a game, so every move of every game on a layout can
+# share the same model.
+TRANSITION_MODEL_CACHE = {}
+
+def getTransitionModel(state):
+    """
+    Returns the TransitionModel for the layout being played in state,
+    building it the first time the layout is seen.
+    """
+    key = '\n'.join(api.layoutText(state))
+    if key not in TRANSITION_MODEL_CACHE:
+        TRANSITION_MODEL_CACHE[key] = TransitionModel(api.wallSet(state), api.corners(state))
+    return TRANSITION_MODEL_CACHE[key]
+
+def outOfTime(deadline, iterationStart):
+    """
+    Returns True if another iteration, taking as long as the one that
+    started at iterationStart, would not be done by deadline.
+    """
+    if deadline is None:
+        return False
+    now = time.time()
+    return now + (now - iterationStart) > deadline
+
+def openCells(walls, width, height):
+    """
+    Returns the non-wall cells of the board, column by column.
+    """
+    return [(x, y) for x in range(width) for y in range(height) if (x, y) not in walls]
+
+def moveFrom(cell, direction):
+    """
+    Returns the cell one step away from cell in the given direction.
+    """
+    dx, dy = Actions.directionToVector(direction)
+    return (cell[0] + int(dx), cell[1] + int(dy))
+
+class TransitionModel:
+    """
+    Pacman's motion model on one layout, compiled once.
+
+    Open cells are numbered in the order of self.cells. For cell i and
+    action a (an index into ACTIONS), row 4 * i + a of the model lists
+    the cells Pacman can end up in and the probability of each, in CSR
+    form: the successors of the row are
+    indices[indptr[row]:indptr[row + 1]], with probabilities in the same
+    slice of data. Pacman moves as intended with probability
+    directionProb and slips to either side with half of what is left;
+    a move into a wall leaves Pacman where it is.
+
+    successors[a][k][i] is the dense form of the same thing: the cell
+    reached from cell i by outcome k of action a, where outcome 0 is the
+    intended move and outcomes 1 and 2 are the slips.
+    """
+
+    def __init__(self, walls, corners, directionProb=api.directionProb):
+        walls = set(walls)
+        self.width = corners[1][0] - corners[0][0] + 1
+        self.height = corners[2][1] - corners[0][1] + 1
+        self.cells = openCells(walls, self.width, self.height)
+        self.index = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.numCells = len(self.cells)
+        self.probabilities = (directionProb, 0.5 * (1 - directionProb), 0.5 * (1 - directionProb))
+
+        self.successors = []
+        for action in ACTIONS:
+            outcomes = []
+            for direction in (action,) + SLIPS[action]:
+                outcomes.append([self.index.get(moveFrom(cell, direction), i)
+                                 for i, cell in enumerate(self.cells)])
+            self.successors.append(outcomes)
+
+        # predecessors[i] lists the cells that some outcome of some action
+        # takes to cell i, which is where a change in the utility of i has
+        # to be propagated to.
+        self.predecessors = [[] for i in range(self.numCells)]
+        for i in range(self.numCells):
+            reached = set()
+            for outcomes in self.successors:
+                for successors in outcomes:
+                    reached.add(successors[i])
+            for j in reached:
+                self.predecessors[j].append(i)
+
+        # Rows with the same successor more than once (a slip into a wall
+        # leaves Pacman in place) get a single entry with the summed
+        # probability.
+        self.indptr = [0]
+        self.indices = []
+        self.data = []
+        for i in range(self.numCells):
+            for a in range(len(ACTIONS)):
+                row = {}
+                order = []
+                for k in range(3):
+                    successor = self.successors[a][k][i]
+                    if successor not in row:
+                        row[successor] = 0.0
+                        order.append(successor)
+                    row[successor] += self.probabilities[k]
+                for successor in order:
+                    self.indices.append(successor)
+                    self.data.append(row[successor])
+                self.indptr.append(len(self.indices))
+
+        self._arrays = None
+
+    def arrays(self):
+        """
+        Returns the model as numpy arrays (indptr, indices, data,
+        successors), building them on first use.
+        """
+        if self._arrays is None:
+            if numpy is None:
+                raise Exception('numpy is needed for the array form of the transition model')
+            self._arrays = (numpy.array(self.indptr, dtype=numpy.intp),
+                            numpy.array(self.indices, dtype=numpy.intp),
+                            numpy.array(self.data, dtype=float),
+                            numpy.array(self.successors, dtype=numpy.intp))
+        return self._arrays
+
+    def expectedUtilities(self, utilities):
+        """
+        Multiplies the model by a vector of utilities, one per open cell.
+
+        Returns the expected utility of every (cell, action) pair, with
+        the entry for cell i and action a at position 4 * i + a.
+        """
+        if numpy is not None:
+            indptr, indices, data, _ = self.arrays()
+            return numpy.add.reduceat(data * numpy.asarray(utilities)[indices], indptr[:-1])
+        expected = []
+        indptr, indices, data = self.indptr, self.indices, self.data
+        for row in range(len(indptr) - 1):
+            total = 0.0
+            for j in range(indptr[row], indptr[row + 1]):
+                total += data[j] * utilities[indices[j]]
+            expected.append(total)
+        return expected
+
+class ArrayValueIteration:
+    """
+    Value iteration over numpy arrays indexed by open cell.
+
+    Uses the dense successor table of a TransitionModel, so each sweep
+    is three gathers, a weighted sum and a max over the actions.
+    """
+
+    def __init__(self, model):
+        if numpy is None:
+            raise Exception('The numpy solver needs numpy to be installed')
+        self.model = model
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Runs value iteration on the rewards in grid, starting from the
+        utilities already in it, and writes the result back into grid.
+
+        Returns the number of sweeps it took to get below epsilon.
+        """
+        cells = self.model.cells
+        rewards = numpy.array([grid.getReward(cell) for cell in cells], dtype=float)
+        utilities = numpy.array([grid.getUtility(cell) for cell in cells], dtype=float)
+        successors = self.model.arrays()[3]
+        intended = successors[:, 0]
+        left = successors[:, 1]
+        right = successors[:, 2]
+
+        sweeps = 0
+        while True:
+            sweeps += 1
+            sweepStart = time.time()
+            expected = utilities[intended] * sameDirectionProb
+            expected += utilities[left] * differentDirectionProb
+            expected += utilities[right] * differentDirectionProb
+            newUtilities = rewards + discount * expected.max(axis=0)
+            delta = numpy.abs(newUtilities - utilities).max()
+            utilities = newUtilities
+            if delta < epsilon or outOfTime(deadline, sweepStart):
+                break
+
+        for cell, utility in zip(cells, utilities.tolist()):
+            grid.updateUtility(cell, utility)
+        self.residual = delta
+        return sweeps
+
+    def close(self):
+        pass
+
+def actionValues(utilities, successors, sameDirectionProb, differentDirectionProb):
+    """
+    Returns the expected utility of each action from each cell, as an
+    array indexed by [action, cell].
+    """
+    values = utilities[successors[:, 0]] * sameDirectionProb
+    values += utilities[successors[:, 1]] * differentDirectionProb
+    values += utilities[successors[:, 2]] * differentDirectionProb
+    return values
+
+def tiedCells(values):
+    """
+    Returns the cells from which more than one action is best.
+    """
+    best = values.max(axis=0)
+    numBest = (values >= best - 1e-9 * numpy.maximum(1.0, numpy.abs(best))).sum(axis=0)
+    return numpy.nonzero(numBest > 1)[0]
+
+def greedyPolicy(values, policy=None):
+    """
+    Returns the best action from each cell given the action values, the
+    first in ACTIONS on a tie the way MDPAgent.getBestHelper breaks them.
+    Where policy is given, its action is kept as long as it is still one
+    of the best, so that policy iteration cannot cycle between equally
+    good policies.
+    """
+    best = values.argmax(axis=0)
+    if policy is None:
+        return best
+    cellIds = numpy.arange(values.shape[1])
+    bestValues = values[best, cellIds]
+    keep = values[policy, cellIds] >= bestValues - 1e-9 * numpy.maximum(1.0, numpy.abs(bestValues))
+    return numpy.where(keep, policy, best)
+
+class PolicyIteration:
+    """
+    Policy iteration, evaluating each policy exactly.
+
+    Starts from the policy that is greedy with respect to the utilities
+    already in the grid. Each iteration works out the utilities of the
+    policy by solving the linear system u = r + discount * P u, where P
+    holds the move probabilities under the policy, and then makes the
+    policy greedy with respect to them. It stops when the policy no
+    longer changes, with the exact utilities of that policy.
+
+    The system is solved as a dense matrix, which is quick on the
+    classic layouts but grows with the cube of the number of open cells.
+    epsilon is not used.
+    """
+
+    def __init__(self, model):
+        if numpy is None:
+            raise Exception('The policy iteration solver needs numpy to be installed')
+        self.model = model
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Runs policy iteration on the rewards in grid and writes the
+        utilities of the final policy back into grid.
+
+        Returns the number of policies it evaluated.
+        """
+        cells = self.model.cells
+        n = self.model.numCells
+        rewards = numpy.array([grid.getReward(cell) for cell in cells], dtype=float)
+        utilities = numpy.array([grid.getUtility(cell) for cell in cells], dtype=float)
+        successors = self.model.arrays()[3]
+        cellIds = numpy.arange(n)
+        probabilities = numpy.array([sameDirectionProb, differentDirectionProb, differentDirectionProb])
+
+        policy = greedyPolicy(actionValues(utilities, successors, sameDirectionProb, differentDirectionProb))
+        iterations = 0
+        while True:
+            iterations += 1
+            iterationStart = time.time()
+            # successors[policy, :, cellIds] is (n, 3): where each outcome
+            # of the chosen action leads from each cell
+            transitions = numpy.zeros((n, n))
+            numpy.add.at(transitions, (cellIds[:, None], successors[policy, :, cellIds]), probabilities)
+            utilities = numpy.linalg.solve(numpy.eye(n) - discount * transitions, rewards)
+            values = actionValues(utilities, successors, sameDirectionProb, differentDirectionProb)
+            newPolicy = greedyPolicy(values, policy)
+            if (newPolicy == policy).all() or outOfTime(deadline, iterationStart):
+                break
+            policy = newPolicy
+
+        self.residual = numpy.abs(rewards + discount * values.max(axis=0) - utilities).max()
+        for cell, utility in zip(cells, utilities.tolist()):
+            grid.updateUtility(cell, utility)
+        return iterations
+
+    def close(self):
+        pass
+
+class ModifiedPolicyIteration:
+    """
+    Modified policy iteration: value iteration in which every Bellman
+    sweep is followed by evaluationSweeps - 1 cheaper sweeps that only
+    follow the greedy policy of the first, instead of maximising over
+    the actions again.
+
+    It stops by the same test as value iteration, when a Bellman sweep
+    changes no utility by epsilon or more. With evaluationSweeps = 1 it
+    is value iteration.
+
+    From a cell where several actions are best, the policy sweeps take
+    the best of those actions rather than picking one. Picking the first
+    would follow East, say, on both sides of a symmetric maze, so that
+    moves that value iteration finds exactly as good as each other would
+    end up a little apart, and ties be broken differently.
+    """
+
+    def __init__(self, model, evaluationSweeps=5):
+        if numpy is None:
+            raise Exception('The modified policy iteration solver needs numpy to be installed')
+        if evaluationSweeps < 1:
+            raise Exception('Modified policy iteration needs at least one evaluation sweep')
+        self.model = model
+        self.evaluationSweeps = evaluationSweeps
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Runs modified policy iteration on the rewards in grid, starting
+        from the utilities already in it, and writes the result back
+        into grid.
+
+        Returns the number of Bellman sweeps it took; each of them is
+        followed by evaluationSweeps - 1 policy sweeps.
+        """
+        cells = self.model.cells
+        rewards = numpy.array([grid.getReward(cell) for cell in cells], dtype=float)
+        utilities = numpy.array([grid.getUtility(cell) for cell in cells], dtype=float)
+        successors = self.model.arrays()[3]
+        cellIds = numpy.arange(self.model.numCells)
+
+        iterations = 0
+        while True:
+            iterations += 1
+            sweepStart = time.time()
+            values = actionValues(utilities, successors, sameDirectionProb, differentDirectionProb)
+            newUtilities = rewards + discount * values.max(axis=0)
+            delta = numpy.abs(newUtilities - utilities).max()
+            utilities = newUtilities
+            if delta < epsilon:
+                break
+
+            chosen = successors[greedyPolicy(values), :, cellIds]
+            intended = chosen[:, 0]
+            left = chosen[:, 1]
+            right = chosen[:, 2]
+            tied = tiedCells(values)
+            tiedSuccessors = successors[:, :, tied]
+            for k in range(self.evaluationSweeps - 1):
+                expected = utilities[intended] * sameDirectionProb
+                expected += utilities[left] * differentDirectionProb
+                expected += utilities[right] * differentDirectionProb
+                if len(tied):
+                    expected[tied] = actionValues(utilities, tiedSuccessors, sameDirectionProb, differentDirectionProb).max(axis=0)
+                utilities = rewards + discount * expected
+            if outOfTime(deadline, sweepStart):
+                break
+
+        self.residual = delta
+        for cell, utility in zip(cells, utilities.tolist()):
+            grid.updateUtility(cell, utility)
+        return iterations
+
+    def close(self):
+        pass
+
+# The arrays the bands of ParallelValueIteration work on. Each worker
+# process fills this in once, when it starts, with numpy views of the
+# shared memory.
+BAND_ARRAYS = {}
+
+def _shareBandArrays(successors, rewards, utilities, numCells):
+    BAND_ARRAYS['successors'] = successors
+    BAND_ARRAYS['rewards'] = numpy.frombuffer(rewards, dtype=float, count=numCells)
+    BAND_ARRAYS['utilities'] = [numpy.frombuffer(buffer, dtype=float, count=numCells) for buffer in utilities]
+
+def _sweepBand(task):
+    """
+    Does one sweep over the cells start to stop, reading the utilities
+    from buffer source and writing them to the other one. Returns the
+    largest change.
+    """
+    start, stop, source, discount, sameDirectionProb, differentDirectionProb = task
+    successors = BAND_ARRAYS['successors'][:, :, start:stop]
+    utilities = BAND_ARRAYS['utilities'][source]
+    expected = utilities[successors[:, 0]] * sameDirectionProb
+    expected += utilities[successors[:, 1]] * differentDirectionProb
+    expected += utilities[successors[:, 2]] * differentDirectionProb
+    newUtilities = BAND_ARRAYS['rewards'][start:stop] + discount * expected.max(axis=0)
+    delta = numpy.abs(newUtilities - utilities[start:stop]).max()
+    BAND_ARRAYS['utilities'][1 - source][start:stop] = newUtilities
+    return delta
+
+class ParallelValueIteration:
+    """
+    ArrayValueIteration with each sweep split across a pool of processes.
+
+    The open cells are split into as many bands as there are workers.
+    Since the cells are numbered column by column, each band is a strip
+    of columns. The rewards and two buffers of utilities are kept in
+    shared memory. In each sweep every worker reads the whole of one
+    buffer and writes its own band of the other, so the bands see each
+    other's boundary values from the previous sweep. This is the same
+    (Jacobi) update as ArrayValueIteration, so the result and the number
+    of sweeps are the same too.
+
+    Each sweep is a round trip to every worker, which only pays off on
+    boards much larger than the classic layouts. With one worker the
+    sweeps are done in this process.
+    """
+
+    def __init__(self, model, workers=None):
+        if numpy is None:
+            raise Exception('The parallel solver needs numpy to be installed')
+        self.model = model
+        self.workers = int(workers or multiprocessing.cpu_count())
+        n = model.numCells
+        self.rewards = multiprocessing.RawArray('d', n)
+        self.utilities = [multiprocessing.RawArray('d', n), multiprocessing.RawArray('d', n)]
+        bounds = [n * k // self.workers for k in range(self.workers + 1)]
+        self.bands = [(bounds[k], bounds[k + 1]) for k in range(self.workers) if bounds[k] < bounds[k + 1]]
+        initargs = (model.arrays()[3], self.rewards, self.utilities, n)
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, _shareBandArrays, initargs)
+        else:
+            self.pool = None
+            _shareBandArrays(*initargs)
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Runs value iteration on the rewards in grid, starting from the
+        utilities already in it, and writes the result back into grid.
+
+        Returns the number of sweeps it took to get below epsilon.
+        """
+        cells = self.model.cells
+        n = self.model.numCells
+        numpy.frombuffer(self.rewards, dtype=float, count=n)[:] = [grid.getReward(cell) for cell in cells]
+        numpy.frombuffer(self.utilities[0], dtype=float, count=n)[:] = [grid.getUtility(cell) for cell in cells]
+
+        sweeps = 0
+        source = 0
+        while True:
+            sweeps += 1
+            sweepStart = time.time()
+            tasks = [(start, stop, source, discount, sameDirectionProb, differentDirectionProb)
+                     for start, stop in self.bands]
+            if self.pool is not None:
+                delta = max(self.pool.map(_sweepBand, tasks))
+            else:
+                delta = max(map(_sweepBand, tasks))
+            source = 1 - source
+            if delta < epsilon or outOfTime(deadline, sweepStart):
+                break
+
+        utilities = numpy.frombuffer(self.utilities[source], dtype=float, count=n)
+        for cell, utility in zip(cells, utilities.tolist()):
+            grid.updateUtility(cell, utility)
+        self.residual = delta
+        return sweeps
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+class SparseValueIteration:
+    """
+    Value iteration as repeated sparse matrix-vector products with a
+    TransitionModel.
+
+    Works on plain lists when numpy is not installed.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def solve(self, grid, discount, sameDirectionProb=None, differentDirectionProb=None, epsilon=0.01, deadline=None):
+        """
+        Runs value iteration on the rewards in grid, starting from the
+        utilities already in it, and writes the result back into grid.
+        The move probabilities are those the model was built with.
+
+        Returns the number of sweeps it took to get below epsilon.
+        """
+        cells = self.model.cells
+        numActions = len(ACTIONS)
+        rewards = [float(grid.getReward(cell)) for cell in cells]
+        utilities = [float(grid.getUtility(cell)) for cell in cells]
+        if numpy is not None:
+            rewards = numpy.array(rewards)
+            utilities = numpy.array(utilities)
+
+        sweeps = 0
+        while True:
+            sweeps += 1
+            sweepStart = time.time()
+            expected = self.model.expectedUtilities(utilities)
+            if numpy is not None:
+                newUtilities = rewards + discount * expected.reshape(-1, numActions).max(axis=1)
+                delta = numpy.abs(newUtilities - utilities).max()
+            else:
+                newUtilities = [rewards[i] + discount * max(expected[numActions * i:numActions * (i + 1)])
+                                for i in range(len(cells))]
+                delta = max([abs(new - old) for new, old in zip(newUtilities, utilities)])
+            utilities = newUtilities
+            if delta < epsilon or outOfTime(deadline, sweepStart):
+                break
+
+        if numpy is not None:
+            utilities = utilities.tolist()
+        for cell, utility in zip(cells, utilities):
+            grid.updateUtility(cell, utility)
+        self.residual = delta
+        return sweeps
+
+    def close(self):
+        pass
+
+class PrioritizedSweeping:
+    """
+    Incremental value iteration for consecutive moves of one game.
+
+    The utilities in the grid are expected to be the previous move's
+    solution. Only the cells whose reward changed since the last call are
+    checked to begin with. A cell whose Bellman residual is at least
+    epsilon is put on a priority queue, largest residual first; when it
+    is backed up, its predecessors are checked in turn. Backups are done
+    in place, so the solve stops as soon as no cell is out by epsilon or
+    more.
+
+    The work done is reported in sweeps, that is in backups divided by
+    the number of open cells, so that it can be compared with the other
+    solvers. The deadline is checked after each sweep's worth of backups,
+    and the residual is the largest one still on the queue.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.previousRewards = None
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Brings the utilities in grid up to date with its rewards.
+
+        Returns the number of sweeps' worth of backups it took.
+        """
+        model = self.model
+        successors = model.successors
+        rewards = [float(grid.getReward(cell)) for cell in model.cells]
+        utilities = [float(grid.getUtility(cell)) for cell in model.cells]
+
+        def backup(i):
+            best = None
+            for outcomes in successors:
+                utility = utilities[outcomes[0][i]] * sameDirectionProb
+                utility += utilities[outcomes[1][i]] * differentDirectionProb
+                utility += utilities[outcomes[2][i]] * differentDirectionProb
+                if best is None or utility > best:
+                    best = utility
+            return rewards[i] + discount * best
+
+        if self.previousRewards is None:
+            changed = range(model.numCells)
+        else:
+            changed = [i for i in range(model.numCells) if rewards[i] != self.previousRewards[i]]
+        self.previousRewards = rewards
+
+        # queued[i] is the residual cell i was last pushed with; entries
+        # that no longer match are stale and are skipped when popped.
+        queue = util.PriorityQueue()
+        queued = {}
+        for i in changed:
+            residual = abs(backup(i) - utilities[i])
+            if residual >= epsilon:
+                queue.push(i, -residual)
+                queued[i] = residual
+
+        backups = 0
+        sweepStart = time.time()
+        while not queue.isEmpty():
+            i = queue.pop()
+            if i not in queued:
+                continue
+            del queued[i]
+            utilities[i] = backup(i)
+            backups += 1
+            if backups % model.numCells == 0:
+                if outOfTime(deadline, sweepStart):
+                    break
+                sweepStart = time.time()
+            for j in model.predecessors[i]:
+                residual = abs(backup(j) - utilities[j])
+                if residual >= epsilon and residual > queued.get(j, 0):
+                    queue.push(j, -residual)
+                    queued[j] = residual
+
+        self.residual = max(queued.values() + [0.0])
+        for cell, utility in zip(model.cells, utilities):
+            grid.updateUtility(cell, utility)
+        return float(backups) / model.numCells
+
+    def close(self):
+        pass
+
+class LocalValueIteration:
+    """
+    Value iteration over the cells within horizon steps of Pacman.
+
+    The cells one step beyond the horizon are held at a boundary value
+    while the cells inside are solved, and the rest of the board is left
+    alone. The boundary value of a cell is, with boundary='rewards', its
+    current reward received forever, reward / (1 - discount), or with
+    boundary='previous', the utility it was last given by this solver
+    (its reward forever, as the first move found it, if it has never been
+    inside the horizon).
+
+    Pacman's position is taken from the grid. The cells within reach of
+    each position, and the successor table renumbered for them, are
+    worked out the first time Pacman is there, so a solve takes time in
+    proportion to the number of cells within the horizon, not to the
+    size of the board.
+    """
+
+    BOUNDARIES = ['rewards', 'previous']
+
+    def __init__(self, model, horizon=10, boundary='rewards'):
+        if numpy is None:
+            raise Exception('The local solver needs numpy to be installed')
+        if boundary not in LocalValueIteration.BOUNDARIES:
+            raise Exception('Unknown boundary ' + str(boundary) + ', expected one of ' + ', '.join(LocalValueIteration.BOUNDARIES))
+        if horizon < 1:
+            raise Exception('The horizon has to be at least 1, to reach the cells next to Pacman')
+        self.model = model
+        self.horizon = horizon
+        self.boundary = boundary
+        self.regions = {}
+        self.utilities = None
+
+    def region(self, i):
+        """
+        Returns the cells within the horizon of cell i, the cells just
+        beyond it, and the successor table of the former in local numbers:
+        the cells inside first, in order, and the boundary after them.
+        """
+        if i not in self.regions:
+            successors = self.model.successors
+            depth = {i: 0}
+            inside = [i]
+            for j in inside:
+                if depth[j] == self.horizon: continue
+                for outcomes in successors:
+                    k = outcomes[0][j]
+                    if k not in depth:
+                        depth[k] = depth[j] + 1
+                        inside.append(k)
+            outside = []
+            local = dict((j, n) for n, j in enumerate(inside))
+            for j in inside:
+                for outcomes in successors:
+                    k = outcomes[0][j]
+                    if k not in local:
+                        local[k] = len(inside) + len(outside)
+                        outside.append(k)
+            table = numpy.array([[[local[outcomes[k][j]] for j in inside] for k in range(3)]
+                                 for outcomes in successors], dtype=numpy.intp)
+            self.regions[i] = (inside, outside, table)
+        return self.regions[i]
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Runs value iteration on the cells within the horizon of Pacman,
+        starting from the utilities already in the grid, and writes their
+        utilities and those of the boundary back into grid.
+
+        Returns the number of sweeps it took to get below epsilon.
+        """
+        cells = self.model.cells
+        inside, outside, table = self.region(self.model.index[grid.pacmanPos])
+        rewards = numpy.array([grid.getReward(cells[j]) for j in inside], dtype=float)
+        if self.boundary == 'previous':
+            if self.utilities is None:
+                self.utilities = numpy.array([grid.getReward(cell) for cell in cells], dtype=float) / (1 - discount)
+            utilities = self.utilities[inside + outside]
+        else:
+            utilities = numpy.array([grid.getUtility(cells[j]) for j in inside] +
+                                    [grid.getReward(cells[j]) / (1 - discount) for j in outside], dtype=float)
+        numInside = len(inside)
+        intended = table[:, 0]
+        left = table[:, 1]
+        right = table[:, 2]
+
+        sweeps = 0
+        while True:
+            sweeps += 1
+            sweepStart = time.time()
+            expected = utilities[intended] * sameDirectionProb
+            expected += utilities[left] * differentDirectionProb
+            expected += utilities[right] * differentDirectionProb
+            newUtilities = rewards + discount * expected.max(axis=0)
+            delta = numpy.abs(newUtilities - utilities[:numInside]).max()
+            utilities[:numInside] = newUtilities
+            if delta < epsilon or outOfTime(deadline, sweepStart):
+                break
+
+        if self.boundary == 'previous':
+            self.utilities[inside] = utilities[:numInside]
+        for j, utility in zip(inside + outside, utilities.tolist()):
+            grid.updateUtility(cells[j], utility)
+        self.residual = delta
+        return sweeps
+
+    def close(self):
+        pass
+
+class GaussSeidelValueIteration:
+    """
+    Value iteration with the backups done in place (Gauss-Seidel).
+
+    Each cell is backed up in turn from the utilities as they are, so a
+    cell backed up later in a sweep already sees the new utilities of
+    the ones before it. Only one list of utilities is kept and nothing
+    is copied per sweep.
+
+    With ordering='cells' the cells are backed up in the order they are
+    numbered. With ordering='sources' they are backed up nearest first
+    to the cells whose rewards stand out, those at least SOURCE_SHARE of
+    the way from the median reward to the most extreme one: the food
+    still to be eaten, the ghosts and their auras. What those cells are
+    worth then spreads out in the same sweep as it is worked out.
+
+    Works on plain lists, one cell at a time, so each sweep is slower
+    than one of the array solvers, but there are fewer of them.
+    """
+
+    ORDERINGS = ['cells', 'sources']
+    SOURCE_SHARE = 0.5
+
+    def __init__(self, model, ordering='cells'):
+        if ordering not in GaussSeidelValueIteration.ORDERINGS:
+            raise Exception('Unknown ordering ' + str(ordering) + ', expected one of ' + ', '.join(GaussSeidelValueIteration.ORDERINGS))
+        self.model = model
+        self.ordering = ordering
+
+    def order(self, rewards):
+        """
+        Returns the cells in the order they are to be backed up.
+        """
+        if self.ordering == 'cells':
+            return range(self.model.numCells)
+        median = sorted(rewards)[len(rewards) // 2]
+        extreme = max([abs(reward - median) for reward in rewards])
+        order = [i for i, reward in enumerate(rewards)
+                 if abs(reward - median) >= GaussSeidelValueIteration.SOURCE_SHARE * extreme]
+        reached = set(order)
+        # A breadth first search out from the sources; the predecessors of
+        # a cell are the cells its utility is read by
+        for i in order:
+            for j in self.model.predecessors[i]:
+                if j not in reached:
+                    reached.add(j)
+                    order.append(j)
+        return order + [i for i in range(self.model.numCells) if i not in reached]
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        """
+        Runs value iteration on the rewards in grid, starting from the
+        utilities already in it, and writes the result back into grid.
+
+        Returns the number of sweeps it took to get below epsilon.
+        """
+        cells = self.model.cells
+        successors = self.model.successors
+        rewards = [float(grid.getReward(cell)) for cell in cells]
+        utilities = [float(grid.getUtility(cell)) for cell in cells]
+        order = self.order(rewards)
+
+        sweeps = 0
+        while True:
+            sweeps += 1
+            sweepStart = time.time()
+            delta = 0.0
+            for i in order:
+                best = None
+                for outcomes in successors:
+                    utility = utilities[outcomes[0][i]] * sameDirectionProb
+                    utility += utilities[outcomes[1][i]] * differentDirectionProb
+                    utility += utilities[outcomes[2][i]] * differentDirectionProb
+                    if best is None or utility > best:
+                        best = utility
+                utility = rewards[i] + discount * best
+                if abs(utility - utilities[i]) > delta:
+                    delta = abs(utility - utilities[i])
+                utilities[i] = utility
+            if delta < epsilon or outOfTime(deadline, sweepStart):
+                break
+
+        self.residual = delta
+        for cell, utility in zip(cells, utilities):
+            grid.updateUtility(cell, utility)
+        return sweeps
+
+    def close(self):
+        pass
+
+# The solvers makeSolver knows, by the name MDPAgent's -a solver= option
+# gives them.
+SOLVERS = {
+    'numpy': ArrayValueIteration,
+    'sparse': SparseValueIteration,
+    'prioritized': PrioritizedSweeping,
+    'parallel': ParallelValueIteration,
+    'policy': PolicyIteration,
+    'modified': ModifiedPolicyIteration,
+    'local': LocalValueIteration,
+    'gaussSeidel': GaussSeidelValueIteration
+}
+
+def makeSolver(name, model, workers=None, evaluationSweeps=5, horizon=10, boundary='rewards', ordering='cells'):
+    """
+    Returns the solver called name for the given TransitionModel.
+    workers is only used by the parallel solver, evaluationSweeps only
+    by modified policy iteration, horizon and boundary only by the local
+    solver and ordering only by the Gauss-Seidel one.
+    """
+    if name not in SOLVERS:
+        raise Exception('Unknown solver ' + str(name) + ', expected one of ' + ', '.join(sorted(SOLVERS)))
+    if name == 'parallel':
+        return ParallelValueIteration(model, workers)
+    if name == 'modified':
+        return ModifiedPolicyIteration(model, evaluationSweeps)
+    if name == 'local':
+        return LocalValueIteration(model, horizon, boundary)
+    if name == 'gaussSeidel':
+        return GaussSeidelValueIteration(model, ordering)
+    return SOLVERS[name](model)
@@ -0,0 +1,86 @@
+# moveProfiler.py
+# ---------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+# Per-move timing of an agent's getAction, phase by phase.
+#
+# An agent calls startMove when a move begins, phase(name) as it moves on
+# to each part of its work, and endMove when it has decided. A phase lasts
+# until the next phase or the end of the move. NullProfiler does nothing
+# and is what agents use unless profiling was asked for.
+
+import json
+import time
+
+class NullProfiler:
+    """
+    Records nothing.
+    """
+    def startMove(self):
+        pass
+
+    def phase(self, name):
+        pass
+
+    def endMove(self, **fields):
+        pass
+
+    def endGame(self):
+        pass
+
+class MoveProfiler:
+    """
+    Appends one JSON record per move to a file, for example
+
+      {"game": 0, "move": 12, "total": 0.0213,
+       "phases": {"observe": 0.0002, "squareRewards": 0.0004, "ghostRewards": 0.0021,
+                  "capsuleRewards": 0.0001, "foodRewards": 0.0009, "gridRows": 0.0004,
+                  "solve": 0.0165, "policy": 0.0007},
+       "sweeps": 34}
+
+    Times are wall-clock seconds. Any keyword arguments passed to endMove are
+    added to the record. Records are appended, so several processes can share
+    one file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.game = 0
+        self.move = 0
+        self.phases = None
+        self.current = None
+
+    def startMove(self):
+        self.phases = {}
+        self.current = None
+        self.moveStart = self.phaseStart = time.time()
+
+    def phase(self, name):
+        now = time.time()
+        if self.current is not None:
+            self.phases[self.current] = self.phases.get(self.current, 0.0) + now - self.phaseStart
+        self.current = name
+        self.phaseStart = now
+
+    def endMove(self, **fields):
+        self.phase(None)
+        record = {'game': self.game, 'move': self.move,
+                  'total': self.phaseStart - self.moveStart, 'phases': self.phases}
+        record.update(fields)
+        # One write per record, so that lines from other processes do not interleave
+        f = open(self.path, 'a')
+        try: f.write(json.dumps(record, sort_keys=True) + '\n')
+        finally: f.close()
+        self.move += 1
+
+    def endGame(self):
+        self.game += 1
+        self.move = 0
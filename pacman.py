@@ -44,6 +44,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -72,14 +73,52 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # static variables keep track of the states generateSuccessor has been
+    # called on and has generated, depending on exploredMode:
+    #   'off'    - nothing is recorded (the default, for playing games);
+    #   'count'  - only exploredCount, the number of successors generated;
+    #   'sample' - the count, and the states themselves in explored. With no
+    #              exploredCap every state is kept; with a cap, explored is a
+    #              uniform sample of at most exploredCap of the successors.
+    EXPLORED_MODES = ['off', 'count', 'sample']
+    exploredMode = 'off'
+    exploredCap = None
     explored = set()
+    exploredCount = 0
+    _exploredSample = []
+    _exploredRandom = random.Random(0)
+
+    def setExploredTracking( mode, cap=None ):
+        if mode not in GameState.EXPLORED_MODES:
+            raise Exception('Unknown explored tracking mode ' + str(mode))
+        GameState.exploredMode = mode
+        GameState.exploredCap = cap
+        GameState.getAndResetExplored()
+    setExploredTracking = staticmethod(setExploredTracking)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
+        tmp = GameState.explored.union(GameState._exploredSample)
         GameState.explored = set()
+        GameState.exploredCount = 0
+        GameState._exploredSample = []
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def recordExplored( parent, successor ):
+        GameState.exploredCount += 1
+        if GameState.exploredMode != 'sample': return
+        cap = GameState.exploredCap
+        if cap is None:
+            GameState.explored.add(parent)
+            GameState.explored.add(successor)
+        elif len(GameState._exploredSample) < cap:
+            GameState._exploredSample.append(successor)
+        else:
+            # Reservoir sampling: keep each successor with probability cap / count
+            i = GameState._exploredRandom.randrange(GameState.exploredCount)
+            if i < cap: GameState._exploredSample[i] = successor
+    recordExplored = staticmethod(recordExplored)
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -113,7 +152,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.writableAgentState(agentIndex) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -121,8 +160,8 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.exploredMode != 'off':
+            GameState.recordExplored(self, state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -174,6 +213,25 @@ class GameState:
         """
         return self.data.capsules
 
+    def getCapsuleSet(self):
+        """
+        Returns a frozenset of the positions of the remaining capsules.
+        """
+        return self.data.getCapsuleSet()
+
+    def getFoodSet(self):
+        """
+        Returns a frozenset of the positions of the remaining food.
+        """
+        return self.data.getFoodSet()
+
+    def getWallSet(self):
+        """
+        Returns a frozenset of the positions of the walls, shared by every
+        state on the layout.
+        """
+        return self.data.layout.getStructure().wallSet
+
     def getNumFood( self ):
         return self.data.food.count()
 
@@ -351,7 +409,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.writableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -370,21 +428,20 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood(position)
             state.data._foodEaten = position
-            # TODO: cache numFood?
+            # O(1) when the food is a BitGrid (--bitGrids)
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.removeCapsule(position)
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.writableAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -413,7 +470,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.writableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -423,7 +480,9 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            # Configurations are shared between copies of a state, so replace rather than change it
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( configuration.pos ), configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -434,12 +493,12 @@ class GhostRules:
                 ghostState = state.data.agentStates[index]
                 ghostPosition = ghostState.configuration.getPosition()
                 if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                    GhostRules.collide( state, ghostState, index )
+                    GhostRules.collide( state, state.data.writableAgentState(index), index )
         else:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                GhostRules.collide( state, ghostState, agentIndex )
+                GhostRules.collide( state, state.data.writableAgentState(agentIndex), agentIndex )
     checkDeath = staticmethod( checkDeath )
 
     def collide( state, ghostState, agentIndex):
@@ -448,6 +507,7 @@ class GhostRules:
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -532,18 +592,34 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--bitGrids', action='store_true', dest='bitGrids',
+                      help='Keep the food in a bit-packed grid (O(1) food count, hash and copy)', default=False)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to spread the games over; more than 1 implies -q'), default=1)
+    parser.add_option('--explored', dest='explored', type='choice', choices=GameState.EXPLORED_MODES,
+                      help=default('Which generated states to record for GameState.getAndResetExplored: off, count or sample'), default='off')
+    parser.add_option('--exploredCap', dest='exploredCap', type='int',
+                      help='The most states to keep with --explored sample [Default: all of them]', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
         raise Exception('Command line input not understood: ' + str(otherjunk))
     args = dict()
 
+    # Games run in other processes are headless
+    if options.workers > 1:
+        if options.numTraining > 0: raise Exception('Training games cannot be spread over workers')
+        options.quietGraphics = True
+
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    GameState.setExploredTracking( options.explored, options.exploredCap )
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
+    if options.bitGrids: args['layout'].useBitFood()
 
     # Choose a Pacman agent
     noKeyboard = options.gameToReplay == None and (options.textGraphics or options.quietGraphics)
@@ -579,6 +655,13 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    if options.workers > 1:
+        # Each worker builds its own agents from these, and seeds each game from the base seed
+        args['workers'] = options.workers
+        args['agentSpec'] = {'pacman': options.pacman, 'agentArgs': options.agentArgs,
+                             'ghost': options.ghost, 'numGhosts': options.numGhosts}
+        if options.fixRandomSeed: args['seed'] = 'cs188'
+        else: args['seed'] = str(random.getrandbits(32))
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -634,7 +717,10 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1, agentSpec=None, seed=None ):
+    if workers > 1:
+        return runGamesInParallel( layout, agentSpec, numGames, record, workers, seed, catchExceptions, timeout )
+
     import __main__
     __main__.__dict__['_display'] = display
 
@@ -656,27 +742,94 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         if not beQuiet: games.append(game)
 
         if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+            recordGame(layout, game.moveHistory, i)
 
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
-        winningScores = [game.state.getScore() for game in games if game.state.isWin()]
-        print 'Winning Scores:', ', '.join([str(score) for score in winningScores])
-        print 'Excellence Score: ', sum(max(score - 1500, 0) for score in winningScores)
+        printSummary([game.state.getScore() for game in games], [game.state.isWin() for game in games],
+                     [len(game.moveHistory) for game in games])
 
     return games
 
+def recordGame( layout, moveHistory, i ):
+    import time, cPickle
+    fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    f = file(fname, 'w')
+    components = {'layout': layout, 'actions': moveHistory}
+    cPickle.dump(components, f)
+    f.close()
+
+def printSummary( scores, wins, moves ):
+    winRate = wins.count(True)/ float(len(wins))
+    print 'Average Score:', sum(scores) / float(len(scores))
+    print 'Scores:       ', ', '.join([str(score) for score in scores])
+    print 'Average Moves:', sum(moves) / float(len(moves))
+    print 'Moves:        ', ', '.join([str(move) for move in moves])
+    print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
+    print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+    winningScores = [score for score, win in zip(scores, wins) if win]
+    print 'Winning Scores:', ', '.join([str(score) for score in winningScores])
+    print 'Excellence Score: ', sum(max(score - 1500, 0) for score in winningScores)
+
+class GameResult:
+    """
+    What a worker process sends back about one game played by runGamesInParallel.
+    """
+    def __init__( self, game ):
+        self.score = game.state.getScore()
+        self.win = game.state.isWin()
+        self.moves = len(game.moveHistory) # by every agent, as printSummary counts them
+        self.moveHistory = game.moveHistory
+        self.agentCrashed = game.agentCrashed
+
+# Per process state of a runGamesInParallel worker
+_worker = {}
+
+def _initWorker( layout, agentSpec, catchExceptions, timeout ):
+    pacmanType = loadAgent(agentSpec['pacman'], True)
+    ghostType = loadAgent(agentSpec['ghost'], True)
+    _worker['layout'] = layout
+    _worker['pacman'] = pacmanType(**parseAgentArgs(agentSpec['agentArgs']))
+    _worker['ghosts'] = [ghostType( i+1 ) for i in range( agentSpec['numGhosts'] )]
+    _worker['rules'] = ClassicGameRules(timeout)
+    _worker['catchExceptions'] = catchExceptions
+
+def _playGame( gameSeed ):
+    import textDisplay
+    random.seed(gameSeed)
+    rules = _worker['rules']
+    game = rules.newGame( _worker['layout'], _worker['pacman'], _worker['ghosts'], textDisplay.NullGraphics(), True, _worker['catchExceptions'])
+    game.run()
+    return GameResult(game)
+
+def runGamesInParallel( layout, agentSpec, numGames, record, workers, seed, catchExceptions=False, timeout=30 ):
+    """
+    Plays numGames games spread over a pool of worker processes, and prints
+    the same summary as runGames.
+
+    Every worker builds its own rules, Pacman and ghosts from agentSpec (the
+    agent names and -a options), and game i is seeded from the base seed and
+    i, so results do not depend on which worker plays which game.
+
+    Returns a list of GameResult, in game order.
+    """
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _initWorker, (layout, agentSpec, catchExceptions, timeout))
+    try:
+        results = pool.map(_playGame, ['%s-%d' % (seed, i) for i in range(numGames)], 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    if record:
+        for i, result in enumerate(results):
+            recordGame(layout, result.moveHistory, i)
+
+    if numGames > 0:
+        printSummary([result.score for result in results], [result.win for result in results],
+                     [result.moves for result in results])
+
+    return results
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
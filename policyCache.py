@@ -0,0 +1,89 @@
+# policyCache.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+# A bounded cache of the moves an agent chose, keyed by the situation it
+# chose them in, that can be saved and loaded again by a later process.
+
+from collections import OrderedDict
+import cPickle
+import os
+
+EVICTIONS = ['lru', 'fifo']
+
+class PolicyCache:
+    """
+    Maps situations to moves, holding at most capacity of them.
+
+    When the cache is full, the entry used least recently ('lru') or the
+    oldest entry ('fifo') makes way for the new one. hits and misses count
+    the lookups that found an entry and those that did not.
+    """
+
+    def __init__(self, capacity, eviction='lru'):
+        if eviction not in EVICTIONS:
+            raise Exception('Unknown eviction ' + str(eviction) + ', expected one of ' + ', '.join(EVICTIONS))
+        self.capacity = capacity
+        self.eviction = eviction
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns the move stored for key, or None.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.entries[key]
+        if self.eviction == 'lru':
+            del self.entries[key]
+            self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+    def load(self, path):
+        """
+        Adds the entries saved in path, if there is such a file, as the
+        oldest ones in the cache.
+        """
+        if not os.path.exists(path): return
+        f = open(path, 'rb')
+        try: saved = cPickle.load(f)
+        finally: f.close()
+        entries = OrderedDict(saved[-self.capacity:])
+        for key, value in self.entries.items():
+            if key in entries: del entries[key]
+            entries[key] = value
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+        self.entries = entries
+
+    def save(self, path):
+        # Write to a temporary file first, so that a process loading the
+        # cache never sees half of it
+        tmpPath = '%s.%d.tmp' % (path, os.getpid())
+        f = open(tmpPath, 'wb')
+        try: cPickle.dump(self.entries.items(), f, cPickle.HIGHEST_PROTOCOL)
+        finally: f.close()
+        os.rename(tmpPath, path)
@@ -0,0 +1,138 @@
+# sweepReport.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+Compares the number of sweeps value iteration takes done the Jacobi way,
+as MDPAgent.valueIteration does it, and the Gauss-Seidel way.
+
+Plays a game on every layout in layouts/ with the MDPAgent, and solves
+the rewards of every move from scratch with each of the solvers in
+COMPARED. Jacobi sweeps are counted with the numpy solver, which does
+the same sweeps as the agent's own loop. For every layout it prints the
+mean number of sweeps per move of each solver, and how many fewer than
+Jacobi that is.
+
+  python sweepReport.py
+  python sweepReport.py -l mediumClassic,originalClassic --maxMoves 50
+"""
+
+from bench import BenchRules
+from bench import allLayouts
+from mdpAgents import MDPAgent
+import copy
+import layout
+import mdpSolvers
+import random
+import sys
+
+# The solvers compared, by name, with their makeSolver options. The first
+# is the one the others are measured against.
+COMPARED = [('jacobi', 'numpy', {}),
+            ('gaussSeidel', 'gaussSeidel', {}),
+            ('sources', 'gaussSeidel', {'ordering': 'sources'})]
+
+def workingGrid(grid):
+    """
+    Returns a grid for a solver to write its utilities to, leaving grid as
+    it is. The solvers only write utilities, so everything else is shared.
+    """
+    working = copy.copy(grid)
+    working.seedUtilities(grid)
+    return working
+
+class ComparingSolver:
+    """
+    Stands in for the agent's solver. Solves every grid it is given with
+    each of the compared solvers, counting their sweeps, then solves it
+    for real with the first of them.
+    """
+    def __init__(self, model):
+        self.solvers = [mdpSolvers.makeSolver(name, model, **options) for _, name, options in COMPARED]
+        self.sweeps = [[] for solver in self.solvers]
+        self.residual = None
+
+    def solve(self, grid, discount, sameDirectionProb, differentDirectionProb, epsilon=0.01, deadline=None):
+        for solver, sweeps in zip(self.solvers[1:], self.sweeps[1:]):
+            sweeps.append(solver.solve(workingGrid(grid), discount, sameDirectionProb, differentDirectionProb, epsilon))
+        self.sweeps[0].append(self.solvers[0].solve(grid, discount, sameDirectionProb, differentDirectionProb, epsilon))
+        self.residual = self.solvers[0].residual
+        return self.sweeps[0][-1]
+
+    def close(self):
+        pass
+
+class SweepCountingAgent(MDPAgent):
+    def __init__(self):
+        MDPAgent.__init__(self, solver='numpy')
+        self.sweeps = None
+
+    def initialise(self, state):
+        MDPAgent.initialise(self, state)
+        self.arraySolver = ComparingSolver(self.transitionModel)
+        self.sweeps = self.arraySolver.sweeps
+
+def countSweeps(layoutName, maxMoves):
+    """
+    Plays a game on the layout and returns the sweeps each of the
+    compared solvers took on each move.
+    """
+    import textDisplay
+    from ghostAgents import RandomGhost
+    board = layout.getLayout(layoutName)
+    agent = SweepCountingAgent()
+    ghosts = [RandomGhost(i + 1) for i in range(board.getNumGhosts())]
+    random.seed('sweeps-%s' % layoutName)
+    game = BenchRules(maxMoves).newGame(board, agent, ghosts, textDisplay.NullGraphics(), True, False)
+    game.run()
+    return agent.sweeps
+
+def report(layouts, maxMoves):
+    print '%-22s %5s' % ('layout', 'moves') + ''.join(['%22s' % name for name, _, _ in COMPARED])
+    totals = [0] * len(COMPARED)
+    for layoutName in layouts:
+        try:
+            sweeps = countSweeps(layoutName, maxMoves)
+        except Exception, e:
+            print '%-22s skipped, %s: %s' % (layoutName, type(e).__name__, e)
+            continue
+        if not sweeps or not sweeps[0]:
+            print '%-22s skipped, no moves' % layoutName
+            continue
+        jacobi = sum(sweeps[0])
+        line = '%-22s %5d %21.2f' % (layoutName, len(sweeps[0]), jacobi / float(len(sweeps[0])))
+        for counts in sweeps[1:]:
+            line += ' %12.2f (%+5.1f%%)' % (sum(counts) / float(len(counts)), 100.0 * (sum(counts) - jacobi) / jacobi)
+        print line
+        sys.stdout.flush()
+        for i, counts in enumerate(sweeps):
+            totals[i] += sum(counts)
+    if totals[0]:
+        print 'In all, ' + ', '.join(['%s %+.1f%%' % (name, 100.0 * (total - totals[0]) / totals[0])
+                                      for (name, _, _), total in zip(COMPARED[1:], totals[1:])]) + ' sweeps against jacobi'
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option('-l', '--layouts', dest='layouts',
+                      help='Comma separated layouts to play [Default: all of layouts/]', default=None)
+    parser.add_option('--maxMoves', dest='maxMoves', type='int',
+                      help='Stop a game after this many Pacman moves [Default: %default]', default=100)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    layouts = options.layouts and options.layouts.split(',') or allLayouts()
+    return options, layouts
+
+if __name__ == '__main__':
+    options, layouts = readCommand(sys.argv[1:])
+    report(layouts, options.maxMoves)